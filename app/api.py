@@ -10,6 +10,10 @@ from schematics.exceptions import DataError
 from schematics.types.base import TypeMeta
 from flask import abort, request, Response, jsonify
 
+from app.deadline import stage
+from app.export import export
+from app.tracing import span
+
 
 # Inheriting this class will make an enum exhaustive
 class EnumMeta(TypeMeta):
@@ -131,6 +135,13 @@ class Error(Model):
             'message': 'Country not supported.',
         })
 
+    @staticmethod
+    def invalid_check_input(message: str):
+        return Error({
+            'type': ErrorType.INVALID_CHECK_INPUT,
+            'message': message,
+        })
+
     @staticmethod
     def missing_required_field(field: str):
         return Error({
@@ -141,6 +152,23 @@ class Error(Model):
             'message': f'Missing required field ({field})',
         })
 
+    @staticmethod
+    def deadline_exceeded(stage: str):
+        return Error({
+            'type': ErrorType.PROVIDER_CONNECTION,
+            'data': {
+                'stage': stage,
+            },
+            'message': 'Check timed out before it could be completed.',
+        })
+
+    @staticmethod
+    def check_interrupted():
+        return Error({
+            'type': ErrorType.PROVIDER_CONNECTION,
+            'message': 'Check was interrupted before it could be completed. Please try again.',
+        })
+
     class Options:
         export_level = NOT_NONE
 
@@ -334,7 +362,8 @@ def validate_models(fn):
     Creates a Schematics Model from the request data and validates it.
 
     Throws DataError if invalid.
-    Otherwise, it passes the validated request data to the wrapped function.
+    Otherwise, it passes the validated request data to the wrapped function, which may return a Response
+    instead of the output model, such as when the result isn't available yet.
     """
 
     signature = inspect.signature(fn)
@@ -350,16 +379,22 @@ def validate_models(fn):
             res = fn(*args, **kwargs)
         else:
             model = None
-            try:
-                model = input_model().import_data(request.json, apply_defaults=True)
-                model.validate()
-            except DataError as e:
-                abort(Response(str(e), status=400))
+            with stage('validation'):
+                try:
+                    with span('import'):
+                        model = input_model().import_data(request.json, apply_defaults=True)
+                    with span('validate'):
+                        model.validate()
+                except DataError as e:
+                    abort(Response(str(e), status=400))
 
             res = fn(model, *args, **kwargs)
 
+        if isinstance(res, Response):
+            return res
         assert isinstance(res, output_model)
 
-        return jsonify(res.serialize())
+        with stage('serialization'):
+            return jsonify(export(res))
 
     return wrapped_fn
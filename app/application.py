@@ -1,16 +1,31 @@
+import atexit
 import json
 import os
-import re
 
-from dataclasses import dataclass
-from typing import Optional, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, send_file, request, abort, Response
+from flask import Flask, request, abort, Response, g, jsonify, url_for
 
-from app.api import RunCheckResponse, RunCheckRequest, validate_models, Error, DatedAddress, ErrorType, Field, Address, \
-    DemoResultType, CommercialRelationshipType, Charge
+from app.api import RunCheckResponse, RunCheckRequest, validate_models, Error
+from app import checks, metrics
+from app.audit import AuditSink
+from app.compression import Compressor, Precompressed
+from app.deadline import Deadline, DeadlineExceeded
+from app.export import export
 from app.http_signature import HTTPSignatureAuth
-from app.startup import integration_key_store
+from app.idempotency import IdempotencyStore
+from app.jobs import JobQueue, Job, QueueFull, COMPLETE
+from app.memory import MemoryDiagnostics
+from app.checks import CheckInput, STATIC_DIR, CONFIG
+from app.provider import UnsupportedProvider
+from app.rate_limit import RateLimiter, InMemoryRateLimitStore, RateLimit, FairScheduler, SlotUnavailable
+from app.retry import RetryingProvider, RetryPolicy
+from app.sessions import SessionCache
+from app.tracing import Tracer, FileSpanExporter, span, tag_trace
+from app.startup import integration_key_store, default_tenant_limit, tenant_limits, provider_concurrency, \
+    provider_queue_timeout, deadline_safety_margin, provider_retry_policy, provider_session_cache, \
+    audit_directory, audit_policy, response_compression, trace_file, trace_sample_rate, trace_slow_threshold, \
+    memory_diagnostics, check_mode, async_checks, async_check_timeout, idempotency
 
 # If `entrypoint` is not defined in app.yaml, App Engine will look for an app
 # called `app` in `main.py`.
@@ -18,15 +33,80 @@ app = Flask(__name__)
 
 auth = HTTPSignatureAuth()
 
-SUPPORTED_COUNTRIES = ['GBR', 'USA', 'CAN', 'NLD']
+rate_limiter = RateLimiter(
+    InMemoryRateLimitStore(),
+    default=RateLimit(**default_tenant_limit),
+    limits={key_id: RateLimit(**{**default_tenant_limit, **limit}) for key_id, limit in tenant_limits.items()}
+)
 
+provider_scheduler = FairScheduler(
+    provider_concurrency,
+    weight_fn=lambda key_id: rate_limiter.limit_for(key_id).weight
+)
 
-@dataclass
-class CheckInput:
-    current_address: Address
-    dob: Optional[str]
-    given_names: List[str]
-    family_name: str
+provider_client = UnsupportedProvider()
+provider_sessions = SessionCache(provider_client, **provider_session_cache).start()
+atexit.register(provider_sessions.close)
+
+provider = RetryingProvider(
+    provider_client,
+    RetryPolicy(**provider_retry_policy),
+    # Each request the scheduler lets through may be hedged
+    executor=ThreadPoolExecutor(max_workers=2 * provider_concurrency, thread_name_prefix='provider'),
+    sessions=provider_sessions
+)
+
+audit_sink = None
+if audit_directory is not None:
+    audit_sink = AuditSink(audit_directory, policy=audit_policy).start()
+    atexit.register(audit_sink.close)
+
+idempotency_store = IdempotencyStore(**idempotency).start()
+atexit.register(idempotency_store.close)
+
+compressor = Compressor(**response_compression)
+
+span_exporter = None
+if trace_file is not None:
+    span_exporter = FileSpanExporter(trace_file).start()
+    atexit.register(span_exporter.close)
+
+tracer = Tracer(span_exporter, sample_rate=trace_sample_rate, slow_threshold=trace_slow_threshold)
+
+diagnostics = MemoryDiagnostics(**memory_diagnostics).init_app(app)
+atexit.register(diagnostics.close)
+
+METADATA = Precompressed.load(os.path.join(STATIC_DIR, 'metadata.json'))
+if check_mode == 'async':
+    CONFIG_FILE = Precompressed(json.dumps({
+        **CONFIG,
+        'check_template': {**CONFIG['check_template'], 'type': 'ONE_TIME_CALLBACK'},
+    }, indent=2).encode())
+else:
+    CONFIG_FILE = Precompressed.load(os.path.join(STATIC_DIR, 'config.json'))
+
+# Leave some of PassFort's timeout for the response to make it back to them
+CHECK_BUDGET = CONFIG['check_template']['timeout'] - deadline_safety_margin
+
+
+@app.before_request
+def start_trace():
+    g.trace_span = tracer.start_trace(
+        'request',
+        request.headers.get('traceparent'),
+        method=request.method,
+        path=request.path
+    )
+
+
+@app.teardown_request
+def end_trace(_exc):
+    tracer.end_trace(g.get('trace_span'))
+
+
+@app.before_request
+def start_deadline():
+    g.deadline = Deadline(CHECK_BUDGET)
 
 
 @app.before_request
@@ -37,10 +117,27 @@ def pre_request_logging():
     app.logger.info(f'{request.method} {request.url}{request_data}')
 
 
+# Registered before the logging hook, so runs after it and the uncompressed response is logged
+@app.after_request
+def compress_response(response):
+    with span('compression'):
+        return compressor.compress_response(request, response)
+
+
+@app.after_request
+def record_status(response):
+    root_span = g.get('trace_span')
+    if root_span is not None:
+        root_span.set_attribute('status_code', response.status_code)
+    return response
+
+
 @app.after_request
 def post_request_logging(response):
     if response.direct_passthrough:
         response_data = '\n(direct pass-through)'
+    elif response.content_encoding:
+        response_data = f'\n({response.content_encoding} encoded, {response.content_length} bytes)'
     else:
         response_data = '\n' + response.data.decode('utf8')
     response_data = response_data.replace('\n', '\n    ')
@@ -49,6 +146,18 @@ def post_request_logging(response):
     return response
 
 
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(e: DeadlineExceeded):
+    res = RunCheckResponse.error([Error.deadline_exceeded(e.stage)])
+
+    # Set once the request is validated, so timeouts before then have nothing to audit
+    req = g.get('check_request')
+    if audit_sink is not None and req is not None:
+        audit_sink.submit(req, res)
+
+    return jsonify(export(res))
+
+
 @auth.resolve_key
 def resolve_key(key_id):
     return integration_key_store.get(key_id)
@@ -56,120 +165,117 @@ def resolve_key(key_id):
 
 @app.route('/')
 def index():
-    return send_file('../static/metadata.json', cache_timeout=-1)
+    return METADATA.response(request, cache_timeout=-1)
 
 
 @app.route('/config')
 @auth.login_required
 def get_config():
-    return send_file('../static/config.json', cache_timeout=-1)
+    return CONFIG_FILE.response(request, cache_timeout=-1)
 
 
-def _sanitize_filename(value: str, program=re.compile('^[a-zA-Z_]+$')):
-    if not program.match(value):
-        abort(Response('Invalid demo request'), status=400)
-    return value
+@app.route('/metrics')
+@auth.login_required
+def get_metrics():
+    return jsonify(metrics.snapshot())
+
+
+@app.route('/diagnostics/memory')
+@auth.login_required
+def get_memory_diagnostics():
+    if not diagnostics.enabled:
+        abort(Response('Memory diagnostics are not enabled', status=404))
+
+    since = request.args.get('since', 'start')
+    if since not in {'start', 'last'}:
+        abort(Response('`since` must be `start` or `last`', status=400))
 
+    return jsonify(diagnostics.report(since, request.args.get('limit', type=int)))
 
-def _run_demo_check(
-    check_input: CheckInput,
-    demo_result: str,
-    commercial_relationship: CommercialRelationshipType
-) -> RunCheckResponse:
-    current_address = check_input.current_address
 
-    def _try_load_demo_result(name: str):
-        filename = f'../static/demo_results/{_sanitize_filename(name)}.json'
+def _schedule_live_check(check_input: CheckInput, req: RunCheckRequest, deadline: Deadline) -> RunCheckResponse:
+    queue_timeout = min(provider_queue_timeout, deadline.remaining())
+    try:
+        with provider_scheduler.slot(auth.key_id(), timeout=queue_timeout):
+            return checks.run_live_check(provider, check_input, req, deadline)
+    except SlotUnavailable:
+        if queue_timeout < provider_queue_timeout:
+            raise DeadlineExceeded('provider')
+        abort(Response('Too many requests', status=429, headers={'Retry-After': '1'}))
 
+
+def _run_queued_check(job: Job) -> RunCheckResponse:
+    def live_check(check_input: CheckInput, req: RunCheckRequest, deadline: Deadline) -> RunCheckResponse:
+        # Nobody is waiting on the response, so there's no need to give up on a slot before the deadline
         try:
-            # Load file relative to current script
-            with open(os.path.join(os.path.dirname(__file__), filename), 'r') as file:
-                demo_response: RunCheckResponse = RunCheckResponse().import_data(
-                    json.load(file), apply_defaults=True)
-        except FileNotFoundError:
-            return None
-
-        check_output = demo_response.check_output
-
-        if check_output is not None and check_output.address_history is not None and current_address is not None:
-            demo_response.check_output.address_history = [
-                DatedAddress({'address': current_address})
-            ]
-
-        if commercial_relationship == CommercialRelationshipType.PASSFORT:
-            demo_response.charges = [
-                Charge({
-                    'amount': 100,
-                    'reference': 'DUMMY REFERENCE'
-                }),
-                Charge({
-                    'amount': 50,
-                    'sku': 'NORMAL'
-                })
-            ]
-
-        return demo_response
-
-    # Default to no matches if we could return any result
-    if demo_result in {DemoResultType.ANY, DemoResultType.ANY_CHARGE}:
-        demo_result = DemoResultType.NO_MATCHES
-
-    return _try_load_demo_result(f'{current_address.country}_{demo_result}') or \
-        _try_load_demo_result(f'OTHER_{demo_result}') or \
-        _try_load_demo_result('UNSUPPORTED_DEMO_RESULT')
-
-
-def _extract_input(req: RunCheckRequest) -> Tuple[List[Error], Optional[CheckInput]]:
-    errors = []
-
-    # Extract address
-    # TODO: Validate required address fields
-    current_address = req.check_input.get_current_address()
-    if current_address is None:
-        errors.append(Error.missing_required_field(Field.ADDRESS_HISTORY))
-
-    # Extract DOB
-    dob = req.check_input.get_dob()
-    if dob is None and req.provider_config.require_dob:
-        errors.append(Error.missing_required_field(Field.DOB))
-
-    # Extract given names
-    given_names = req.check_input.get_given_names()
-    if given_names is None:
-        errors.append(Error.missing_required_field(Field.GIVEN_NAMES))
-
-    # Extract family name
-    family_name = req.check_input.get_family_name()
-    if family_name is None:
-        errors.append(Error.missing_required_field(Field.FAMILY_NAME))
-
-    if errors:
-        return errors, None
-    else:
-        return [], CheckInput(
-            current_address=current_address,
-            dob=dob,
-            given_names=given_names,
-            family_name=family_name
-        )
+            with provider_scheduler.slot(job.key_id, timeout=deadline.remaining()):
+                return checks.run_live_check(provider, check_input, req, deadline)
+        except SlotUnavailable:
+            raise DeadlineExceeded('provider')
+
+    try:
+        return checks.run_check(job.request, Deadline(async_check_timeout), live_check)
+    except DeadlineExceeded as e:
+        return RunCheckResponse.error([Error.deadline_exceeded(e.stage)])
+
+
+def _queued_check_complete(job: Job):
+    if audit_sink is not None:
+        audit_sink.submit(job.request, job.response)
+
+
+job_queue = None
+if check_mode == 'async':
+    job_queue = JobQueue(_run_queued_check, on_complete=_queued_check_complete, **async_checks).start()
+    atexit.register(job_queue.close)
+
+
+def _job_response(job: Job) -> Response:
+    if job.state == COMPLETE:
+        return jsonify(export(job.response))
+
+    response = jsonify({'id': job.id, 'state': job.state})
+    response.status_code = 202
+    response.headers['Location'] = url_for('get_check', check_id=job.id)
+    response.headers['Retry-After'] = '1'
+    return response
 
 
 @app.route('/checks', methods=['POST'])
 @auth.login_required
+@rate_limiter.limited(auth.key_id)
 @validate_models
 def run_check(req: RunCheckRequest) -> RunCheckResponse:
-    errors, check_input = _extract_input(req)
-    if errors:
-        return RunCheckResponse.error(errors)
+    tag_trace(check_id=str(req.id))
+
+    if job_queue is not None:
+        try:
+            return _job_response(job_queue.submit(auth.key_id(), req))
+        except QueueFull:
+            abort(Response('Too many requests', status=429, headers={'Retry-After': '1'}))
+
+    g.check_request = req
+
+    def run() -> dict:
+        res = checks.run_check(req, g.deadline, _schedule_live_check)
 
-    country = check_input.current_address.country
-    if country not in SUPPORTED_COUNTRIES:
-        return RunCheckResponse.error([Error.unsupported_country()])
+        if audit_sink is not None:
+            audit_sink.submit(req, res)
 
-    if req.demo_result is not None:
-        return _run_demo_check(check_input, req.demo_result, req.commercial_relationship)
+        # However late, a result that exists is returned (and recorded), as giving up on it now would have
+        # PassFort retry, and the check run and charged for again. The safety margin is kept for this.
+        with g.deadline.stage('serialization', check=False):
+            return export(res)
 
-    return RunCheckResponse.error([Error({
-        'type': ErrorType.PROVIDER_MESSAGE,
-        'message': 'Live checks are not supported',
-    })])
+    # PassFort retries checks that time out, which mustn't run (and charge for) the check again
+    response = idempotency_store.run(auth.key_id(), str(req.id), run, timeout=g.deadline.remaining())
+    return jsonify(response)
+
+
+@app.route('/checks/<uuid:check_id>')
+@auth.login_required
+def get_check(check_id):
+    job = job_queue.get(auth.key_id(), str(check_id)) if job_queue is not None else None
+    if job is None:
+        abort(Response('Check not found', status=404))
+    return _job_response(job)
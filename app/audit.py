@@ -0,0 +1,182 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from datetime import datetime, timezone
+from typing import Optional, List, Tuple
+
+from app.api import RunCheckRequest, RunCheckResponse
+from app.export import export
+from app.metrics import Counter, Gauge
+
+audit_queue_depth = Gauge('audit_queue_depth', 'Check results waiting to be written to the audit log')
+audit_records = Counter('audit_records', 'Check results handled by the audit log, by outcome')
+
+BLOCK = 'block'
+DROP = 'drop'
+
+_STOP = object()
+
+
+def _to_record(req: RunCheckRequest, res: RunCheckResponse, received_at: float) -> dict:
+    # Not `serialize()`, which validates the models, replacing their data while request threads may be
+    # exporting them
+    check_input = export(req)
+    # Never persist credentials
+    check_input.pop('provider_credentials', None)
+
+    output = export(res)
+    charges = output.pop('charges', [])
+
+    return {
+        'id': str(req.id),
+        'received_at': datetime.fromtimestamp(received_at, timezone.utc).isoformat(),
+        'input': check_input,
+        'output': output,
+        'charges': charges,
+    }
+
+
+class _Segment:
+    def __init__(self, path: str):
+        self.path = path
+        self.opened_at = time.monotonic()
+        self._raw = open(f'{path}.part', 'wb')
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode='wb')
+
+    @property
+    def size(self) -> int:
+        # Compressed bytes written so far
+        return self._raw.tell()
+
+    def write(self, lines: List[bytes]):
+        self._gzip.write(b''.join(lines))
+        # Sync flush, so everything written so far can be recovered if the process dies
+        self._gzip.flush()
+
+    def close(self):
+        self._gzip.close()
+        self._raw.close()
+        os.rename(f'{self.path}.part', self.path)
+
+
+class AuditSink:
+    """
+    Writes every completed check to gzipped NDJSON segment files, off the request path.
+
+    Results are queued by `submit` and serialized and written in batches by a background thread. Once
+    the queue is full, `submit` either waits for space (`BLOCK`) or discards the result (`DROP`).
+    Segments are rotated once they reach `max_segment_bytes` compressed, or are `max_segment_age`
+    seconds old, and are only given their final name once closed.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_queue: int = 10000,
+        policy: str = BLOCK,
+        block_timeout: float = 1.0,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_segment_bytes: int = 64 * 1024 * 1024,
+        max_segment_age: float = 3600
+    ):
+        assert policy in {BLOCK, DROP}, f'Unknown audit policy `{policy}`'
+
+        self.directory = directory
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._segment: Optional[_Segment] = None
+        self._segment_count = 0
+        self._thread = threading.Thread(target=self._run, name='audit-sink', daemon=True)
+
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self) -> 'AuditSink':
+        self._thread.start()
+        return self
+
+    def submit(self, req: RunCheckRequest, res: RunCheckResponse) -> bool:
+        item = (req, res, time.time())
+        try:
+            if self.policy == BLOCK:
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            audit_records.inc(outcome='dropped')
+            logging.warning(f'Audit queue full, dropped result for check {req.id}')
+            return False
+
+        audit_queue_depth.set(self._queue.qsize())
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Writes out everything queued so far and closes the current segment.
+        """
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _new_segment(self) -> _Segment:
+        self._segment_count += 1
+        timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        filename = f'audit-{timestamp}-{os.getpid()}-{self._segment_count:06d}.ndjson.gz'
+        return _Segment(os.path.join(self.directory, filename))
+
+    def _write(self, batch: List[Tuple[RunCheckRequest, RunCheckResponse, float]]):
+        lines = []
+        for req, res, received_at in batch:
+            try:
+                lines.append(json.dumps(_to_record(req, res, received_at)).encode() + b'\n')
+            except Exception:
+                audit_records.inc(outcome='failed')
+                logging.exception(f'Unable to serialize audit record for check {req.id}')
+
+        if self._segment is None:
+            self._segment = self._new_segment()
+        self._segment.write(lines)
+        audit_records.inc(len(lines), outcome='written')
+
+    def _rotate_if_needed(self, force: bool = False):
+        if self._segment is None:
+            return
+        too_old = time.monotonic() - self._segment.opened_at >= self.max_segment_age
+        if force or too_old or self._segment.size >= self.max_segment_bytes:
+            self._segment.close()
+            self._segment = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            batch_deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, batch_deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            audit_queue_depth.set(self._queue.qsize())
+            try:
+                if batch:
+                    self._write(batch)
+                self._rotate_if_needed(force=stopping)
+            except OSError:
+                logging.exception(f'Unable to write {len(batch)} audit records')
+                audit_records.inc(len(batch), outcome='failed')
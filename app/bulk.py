@@ -0,0 +1,305 @@
+"""
+Runs checks in bulk over stored individuals, such as for periodic re-screening, without going through `/checks`.
+
+    python -m app.bulk individuals.ndjson results.ndjson --demo-result NO_MATCHES --processes 8
+
+Input is either NDJSON, with one check request per line as it would be sent to `/checks`, or CSV, with one
+individual per row (see `csv_request`). Fields missing from a request are taken from the command line
+options, so NDJSON lines need only hold an `id` and `check_input`.
+
+Records are streamed from the input and handed to a pool of processes in chunks, with only a few chunks in
+flight at once, so memory use does not grow with the size of the input. Results are written in input order,
+one `{"id": ..., "result": ...}` object per line. After each chunk the progress is saved to
+`<output>.checkpoint`, and `--resume` continues an interrupted run from there.
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Iterator, Union, List, Optional, Tuple, Iterable, Dict
+
+from schematics.exceptions import DataError
+from werkzeug.exceptions import HTTPException
+
+from app import checks
+from app.api import RunCheckRequest, RunCheckResponse, Error, StructuredAddress
+from app.deadline import Deadline, DeadlineExceeded
+from app.export import export
+from app.provider import UnsupportedProvider
+from app.retry import RetryingProvider, RetryPolicy
+from app.sessions import SessionCache
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+
+ADDRESS_COLUMNS = set(StructuredAddress.fields) - {'address_lines'}
+
+# A line of NDJSON, or a row of CSV
+Record = Union[str, Dict[str, str]]
+
+
+@dataclass
+class Checkpoint:
+    records: int = 0
+    output_bytes: int = 0
+
+    @classmethod
+    def load(cls, path: str) -> Optional['Checkpoint']:
+        try:
+            with open(path, 'r') as file:
+                return cls(**json.load(file))
+        except FileNotFoundError:
+            return None
+
+    def save(self, path: str):
+        # Replaced in one step, so an interrupted save leaves the previous checkpoint intact
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(asdict(self), file)
+        os.replace(f'{path}.tmp', path)
+
+
+def csv_request(row: Dict[str, str]) -> dict:
+    """
+    Builds a check request from a CSV row. Columns are `id`, `title`, `given_names` (separated by spaces),
+    `family_name`, `dob`, `gender`, `nationality`, `demo_result`, and the fields of a structured address,
+    such as `country`, `postal_code` and `street_number`, for the current address. Empty values are ignored.
+    """
+    values = {key: value.strip() for key, value in row.items() if key and value and value.strip()}
+
+    name = {key: values[key] for key in ('title', 'family_name') if key in values}
+    if 'given_names' in values:
+        name['given_names'] = values['given_names'].split()
+
+    personal_details = {key: values[key] for key in ('dob', 'gender', 'nationality') if key in values}
+    if name:
+        personal_details['name'] = name
+
+    check_input = {'entity_type': 'INDIVIDUAL', 'personal_details': personal_details}
+    address = {key: value for key, value in values.items() if key in ADDRESS_COLUMNS}
+    if address:
+        check_input['address_history'] = [{'address': {'type': 'STRUCTURED', **address}}]
+
+    request = {'check_input': check_input}
+    for key in ('id', 'demo_result'):
+        if key in values:
+            request[key] = values[key]
+    return request
+
+
+def read_records(path: str, input_format: str, skip: int = 0) -> Iterator[Record]:
+    """
+    Yields the records in a file, after the first `skip`. Blank NDJSON lines are not records.
+    """
+    with open(path, 'r', newline='' if input_format == CSV else None) as file:
+        if input_format == CSV:
+            records = csv.DictReader(file)
+        else:
+            records = (line for line in file if line.strip())
+        yield from itertools.islice(records, skip, None)
+
+
+def _chunks(records: Iterable[Record], size: int) -> Iterator[List[Record]]:
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class BulkRunner:
+    """
+    Runs the check pipeline over records, in a worker process.
+    """
+
+    def __init__(self, input_format: str, template: dict, timeout: float, max_attempts: int):
+        self.input_format = input_format
+        self.template = template
+        self.timeout = timeout
+        client = UnsupportedProvider()
+        # Stored individuals tend to share a handful of tenants' credentials
+        self.provider = RetryingProvider(
+            client,
+            RetryPolicy(max_attempts=max_attempts),
+            # Records are checked one at a time, so only a request and its hedge are ever in flight
+            executor=ThreadPoolExecutor(max_workers=2, thread_name_prefix='provider'),
+            sessions=SessionCache(client).start()
+        )
+
+    def _live_check(self, check_input: checks.CheckInput, req: RunCheckRequest, deadline: Deadline):
+        return checks.run_live_check(self.provider, check_input, req, deadline)
+
+    def run_record(self, record: Record) -> Tuple[Optional[str], RunCheckResponse]:
+        data = None
+        try:
+            data = csv_request(record) if self.input_format == CSV else json.loads(record)
+            req = RunCheckRequest().import_data({**self.template, **data}, apply_defaults=True)
+            req.validate()
+        except (ValueError, TypeError, DataError) as e:
+            check_id = data.get('id') if isinstance(data, dict) else None
+            return check_id, RunCheckResponse.error([Error.invalid_check_input(f'Invalid check request: {e}')])
+
+        try:
+            res = checks.run_check(req, Deadline(self.timeout), self._live_check)
+        except DeadlineExceeded as e:
+            res = RunCheckResponse.error([Error.deadline_exceeded(e.stage)])
+        except HTTPException as e:
+            message = e.response.get_data(as_text=True) if e.response is not None else e.description
+            res = RunCheckResponse.error([Error.invalid_check_input(message)])
+        except Exception:
+            # Only this record fails, rather than the whole run, which would fail again on every resume
+            logging.exception(f'Unable to run check {req.id}')
+            res = RunCheckResponse.error([Error.check_interrupted()])
+
+        return str(req.id), res
+
+    def run_chunk(self, chunk: List[Record]) -> bytes:
+        lines = []
+        for record in chunk:
+            check_id, res = self.run_record(record)
+            lines.append(json.dumps({'id': check_id, 'result': export(res)}) + '\n')
+        return ''.join(lines).encode()
+
+
+_runner: Optional[BulkRunner] = None
+
+
+def _init_worker(*args):
+    global _runner
+    _runner = BulkRunner(*args)
+
+
+def _run_chunk(chunk: List[Record]) -> Tuple[int, bytes]:
+    return len(chunk), _runner.run_chunk(chunk)
+
+
+def run_bulk(
+    input_path: str,
+    output_path: str,
+    input_format: str,
+    template: dict,
+    timeout: float,
+    max_attempts: int = 1,
+    processes: int = os.cpu_count(),
+    chunk_size: int = 500,
+    resume: bool = False,
+    progress_interval: float = 5.0
+) -> Tuple[int, float]:
+    """
+    Runs a check for every record in `input_path`, writing the results to `output_path`.
+
+    Returns the number of records checked, and how long it took.
+    """
+    checkpoint_path = f'{output_path}.checkpoint'
+    checkpoint = Checkpoint.load(checkpoint_path) if resume else None
+
+    if checkpoint is None:
+        # Don't leave an earlier run's checkpoint to be resumed from against this run's output
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        checkpoint = Checkpoint()
+        output = open(output_path, 'wb')
+    else:
+        # Anything written after the checkpoint will be written again
+        output = open(output_path, 'r+b')
+        output.truncate(checkpoint.output_bytes)
+        output.seek(checkpoint.output_bytes)
+
+    started_at = time.perf_counter()
+    reported_at = started_at
+    checked = 0
+
+    def write(result: Tuple[int, bytes]):
+        nonlocal checked, reported_at
+        count, data = result
+        output.write(data)
+        output.flush()
+
+        checkpoint.records += count
+        checkpoint.output_bytes = output.tell()
+        checkpoint.save(checkpoint_path)
+        checked += count
+
+        now = time.perf_counter()
+        if now - reported_at >= progress_interval:
+            reported_at = now
+            print(f'{checkpoint.records:,} records, {checked / (now - started_at):,.1f}/s', file=sys.stderr)
+
+    records = read_records(input_path, input_format, skip=checkpoint.records)
+    with output, ProcessPoolExecutor(
+        processes,
+        initializer=_init_worker,
+        initargs=(input_format, template, timeout, max_attempts)
+    ) as executor:
+        # Enough chunks to keep every process busy, while holding only a few in memory
+        pending = deque()
+        for chunk in _chunks(records, chunk_size):
+            pending.append(executor.submit(_run_chunk, chunk))
+            if len(pending) >= 2 * processes:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+
+    return checked, time.perf_counter() - started_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run checks in bulk over stored individuals')
+    parser.add_argument('input', help='NDJSON or CSV file of check requests')
+    parser.add_argument('output', help='NDJSON file results are written to')
+    parser.add_argument('--format', choices=[NDJSON, CSV],
+                        help='Format of the input, by default taken from its extension')
+    parser.add_argument('--resume', action='store_true', help='Continue from the last checkpoint')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=500, help='Records sent to a process at a time')
+    parser.add_argument('--progress-interval', type=float, default=5.0, help='Seconds between progress reports')
+    parser.add_argument('--timeout', type=float, default=checks.CONFIG['check_template']['timeout'],
+                        help='Seconds each check may take')
+    parser.add_argument('--max-attempts', type=int, default=3, help='Attempts made for each live provider request')
+    parser.add_argument('--demo-result', help='Demo result for requests that do not specify one')
+    parser.add_argument('--commercial-relationship', default='DIRECT', choices=['DIRECT', 'PASSFORT'])
+    parser.add_argument('--require-dob', action='store_true')
+    parser.add_argument('--no-mortality-check', action='store_true')
+    parser.add_argument('--requires-address-on-all-matches', action='store_true')
+    parser.add_argument('--run-original-address', action='store_true')
+    args = parser.parse_args()
+
+    input_format = args.format or (CSV if args.input.lower().endswith('.csv') else NDJSON)
+
+    template = {
+        'commercial_relationship': args.commercial_relationship,
+        'provider_config': {
+            'require_dob': args.require_dob,
+            'mortality_check': not args.no_mortality_check,
+            'requires_address_on_all_matches': args.requires_address_on_all_matches,
+            'run_original_address': args.run_original_address,
+        },
+    }
+    if args.demo_result is not None:
+        template['demo_result'] = args.demo_result
+
+    checked, elapsed = run_bulk(
+        args.input,
+        args.output,
+        input_format,
+        template,
+        timeout=args.timeout,
+        max_attempts=args.max_attempts,
+        processes=args.processes,
+        chunk_size=args.chunk_size,
+        resume=args.resume,
+        progress_interval=args.progress_interval
+    )
+    print(f'{checked:,} records in {elapsed:.1f}s ({checked / elapsed if elapsed else 0:,.1f}/s)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+The check pipeline, independent of how checks arrive: through `/checks`, or in bulk (see `app.bulk`).
+
+This module must not depend on `app.startup`, so checks can be run without the service's configuration.
+"""
+import json
+import os
+import re
+
+from dataclasses import dataclass
+from typing import Optional, List, Tuple, Callable
+
+from flask import abort, Response
+
+from app.api import RunCheckResponse, RunCheckRequest, Error, DatedAddress, Field, Address, DemoResultType, \
+    CommercialRelationshipType
+from app.deadline import Deadline
+from app.pricing import PriceTable, count_matched_databases
+from app.provider import ProviderError
+from app.retry import RetryingProvider
+
+SUPPORTED_COUNTRIES = ['GBR', 'USA', 'CAN', 'NLD']
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), '../static')
+
+with open(os.path.join(STATIC_DIR, 'config.json'), 'r') as _config_file:
+    CONFIG = json.load(_config_file)
+
+# Demo results are only read once, but are imported afresh for each check as they are modified
+DEMO_RESULTS = {}
+for _filename in os.listdir(os.path.join(STATIC_DIR, 'demo_results')):
+    with open(os.path.join(STATIC_DIR, 'demo_results', _filename), 'r') as _demo_result_file:
+        DEMO_RESULTS[os.path.splitext(_filename)[0]] = json.load(_demo_result_file)
+
+price_table = PriceTable.load(
+    os.path.join(STATIC_DIR, 'pricing.json'),
+    maximum_cost=CONFIG['pricing']['maximum_cost']
+)
+
+
+@dataclass
+class CheckInput:
+    current_address: Address
+    dob: Optional[str]
+    given_names: List[str]
+    family_name: str
+
+
+# Runs a check against the provider, for checks that are not demo checks
+LiveCheck = Callable[[CheckInput, RunCheckRequest, Deadline], RunCheckResponse]
+
+
+def _sanitize_filename(value: str, program=re.compile('^[a-zA-Z_]+$')):
+    if not program.match(value):
+        abort(Response('Invalid demo request', status=400))
+    return value
+
+
+def run_demo_check(check_input: CheckInput, demo_result: str) -> RunCheckResponse:
+    current_address = check_input.current_address
+
+    def _try_load_demo_result(name: str):
+        demo_data = DEMO_RESULTS.get(_sanitize_filename(name))
+        if demo_data is None:
+            return None
+
+        demo_response: RunCheckResponse = RunCheckResponse().import_data(demo_data, apply_defaults=True)
+
+        check_output = demo_response.check_output
+
+        if check_output is not None and check_output.address_history is not None and current_address is not None:
+            demo_response.check_output.address_history = [
+                DatedAddress({'address': current_address})
+            ]
+
+        return demo_response
+
+    # Default to no matches if we could return any result
+    if demo_result in {DemoResultType.ANY, DemoResultType.ANY_CHARGE}:
+        demo_result = DemoResultType.NO_MATCHES
+
+    return _try_load_demo_result(f'{current_address.country}_{demo_result}') or \
+        _try_load_demo_result(f'OTHER_{demo_result}') or \
+        _try_load_demo_result('UNSUPPORTED_DEMO_RESULT')
+
+
+def run_live_check(
+    provider: RetryingProvider,
+    check_input: CheckInput,
+    req: RunCheckRequest,
+    deadline: Deadline
+) -> RunCheckResponse:
+    try:
+        return provider.run_check(check_input, req, deadline)
+    except ProviderError as e:
+        return RunCheckResponse.error([e.to_error()])
+
+
+def extract_input(req: RunCheckRequest) -> Tuple[List[Error], Optional[CheckInput]]:
+    errors = []
+
+    # Extract address
+    # TODO: Validate required address fields
+    current_address = req.check_input.get_current_address()
+    if current_address is None:
+        errors.append(Error.missing_required_field(Field.ADDRESS_HISTORY))
+
+    # Extract DOB
+    dob = req.check_input.get_dob()
+    if dob is None and req.provider_config.require_dob:
+        errors.append(Error.missing_required_field(Field.DOB))
+
+    # Extract given names
+    given_names = req.check_input.get_given_names()
+    if given_names is None:
+        errors.append(Error.missing_required_field(Field.GIVEN_NAMES))
+
+    # Extract family name
+    family_name = req.check_input.get_family_name()
+    if family_name is None:
+        errors.append(Error.missing_required_field(Field.FAMILY_NAME))
+
+    if errors:
+        return errors, None
+    else:
+        return [], CheckInput(
+            current_address=current_address,
+            dob=dob,
+            given_names=given_names,
+            family_name=family_name
+        )
+
+
+def run_check(req: RunCheckRequest, deadline: Deadline, live_check: LiveCheck) -> RunCheckResponse:
+    with deadline.stage('extract_input'):
+        errors, check_input = extract_input(req)
+    if errors:
+        return RunCheckResponse.error(errors)
+
+    country = check_input.current_address.country
+    if country not in SUPPORTED_COUNTRIES:
+        return RunCheckResponse.error([Error.unsupported_country()])
+
+    with deadline.stage('provider'):
+        if req.demo_result is not None:
+            res = run_demo_check(check_input, req.demo_result)
+        else:
+            res = live_check(check_input, req, deadline)
+
+    # Only checks that produced a result are charged for
+    if req.commercial_relationship == CommercialRelationshipType.PASSFORT and not res.errors:
+        res.charges = price_table.charges(country, count_matched_databases(res.check_output))
+
+    return res
@@ -0,0 +1,135 @@
+"""
+Response compression.
+
+Responses are compressed with gzip, or brotli if the optional `brotli` package is installed, as negotiated
+through the request's `Accept-Encoding`. Static payloads are compressed once, at the highest level, when they
+are loaded. Dynamic responses are compressed as they are sent, at a configurable level, and only once they are
+large enough for the bytes saved to be worth the CPU time.
+"""
+import hashlib
+import time
+import zlib
+
+from typing import Optional, Dict
+
+from flask import Request, Response
+
+from app.metrics import Counter, Histogram
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+
+# In order of preference, when a client accepts more than one equally
+ENCODINGS = (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+MAX_LEVELS = {GZIP: 9, BROTLI: 11}
+DEFAULT_LEVELS = {GZIP: 1, BROTLI: 1}
+
+COMPRESSIBLE_MIMETYPES = {'application/json'}
+
+compression_input_bytes = Counter('compression_input_bytes', 'Bytes of dynamic responses before compression')
+compression_output_bytes = Counter('compression_output_bytes', 'Bytes of dynamic responses after compression')
+compression_seconds = Histogram(
+    'compression_seconds',
+    'Time spent compressing dynamic responses',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+)
+
+
+def negotiate(request: Request) -> Optional[str]:
+    """
+    Returns the preferred encoding the client accepts, or None if it should be sent uncompressed.
+    """
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == BROTLI:
+        return brotli.compress(data, quality=level)
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class Precompressed:
+    """
+    A static payload, held uncompressed and compressed with each supported encoding.
+    """
+    def __init__(self, data: bytes, mimetype: str = 'application/json'):
+        self.data = data
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(data).hexdigest()
+        self.encoded: Dict[str, bytes] = {}
+
+        for encoding in ENCODINGS:
+            encoded = compress(data, encoding, MAX_LEVELS[encoding])
+            if len(encoded) < len(data):
+                self.encoded[encoding] = encoded
+
+    @classmethod
+    def load(cls, path: str, mimetype: str = 'application/json') -> 'Precompressed':
+        with open(path, 'rb') as file:
+            return cls(file.read(), mimetype)
+
+    def response(self, request: Request, cache_timeout: Optional[int] = None) -> Response:
+        encoding = negotiate(request)
+        encoded = self.encoded.get(encoding)
+
+        if encoded is None:
+            response = Response(self.data, mimetype=self.mimetype)
+            response.set_etag(self.etag)
+        else:
+            response = Response(encoded, mimetype=self.mimetype)
+            response.content_encoding = encoding
+            # Each encoding is a different representation, so needs its own tag
+            response.set_etag(f'{self.etag}-{encoding}')
+
+        response.vary.add('Accept-Encoding')
+        if cache_timeout is not None:
+            response.cache_control.public = True
+            response.cache_control.max_age = cache_timeout
+            response.expires = int(time.time() + cache_timeout)
+
+        return response.make_conditional(request)
+
+
+class Compressor:
+    def __init__(self, min_size: int = 1024, levels: Optional[Dict[str, int]] = None):
+        self.min_size = min_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+
+    def compress_response(self, request: Request, response: Response) -> Response:
+        """
+        Compresses `response` in place if the client accepts it and it is worth doing.
+        """
+        if response.direct_passthrough or response.content_encoding or response.status_code != 200 or \
+                response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        encoding = negotiate(request)
+        if encoding is None:
+            return response
+
+        started_at = time.perf_counter()
+        encoded = compress(data, encoding, self.levels[encoding])
+        compression_seconds.observe(time.perf_counter() - started_at, encoding=encoding)
+
+        compression_input_bytes.inc(len(data), encoding=encoding)
+        compression_output_bytes.inc(min(len(encoded), len(data)), encoding=encoding)
+
+        if len(encoded) < len(data):
+            response.set_data(encoded)
+            response.content_encoding = encoding
+
+        return response
@@ -0,0 +1,89 @@
+import time
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from flask import g, has_request_context
+
+from app.metrics import Histogram, Counter
+from app.tracing import span
+
+stage_seconds = Histogram('check_stage_seconds', 'Time spent in each stage of a check')
+stage_budget_used = Histogram(
+    'check_stage_budget_used',
+    'Fraction of the check timeout used by each stage',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 1)
+)
+deadlines_exceeded = Counter('check_deadlines_exceeded', 'Checks abandoned because the timeout ran out, by stage')
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str):
+        super().__init__(f'Deadline exceeded before `{stage}` completed')
+        self.stage = stage
+
+
+class Deadline:
+    """
+    Tracks how much of a check's timeout budget remains.
+
+    Work is split into named stages, each of which is also traced as a span. Entering a stage once the
+    budget has run out raises `DeadlineExceeded`, and anything that blocks (provider calls, retries,
+    queues) should be bounded by `remaining()` so it is abandoned rather than outliving the request.
+    """
+
+    def __init__(self, budget: float, clock: Callable[[], float] = time.monotonic):
+        self.budget = budget
+        self.clock = clock
+        self.expires_at = clock() + budget
+        self.stages: Dict[str, float] = {}
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.clock() >= self.expires_at
+
+    def check(self, stage: str):
+        if self.expired:
+            deadlines_exceeded.inc(stage=stage)
+            raise DeadlineExceeded(stage)
+
+    @contextmanager
+    def stage(self, name: str, check: bool = True):
+        """
+        Runs the enclosed block as the stage `name`. With `check=False` the stage is only timed, for work
+        that should be finished even once the budget has run out.
+        """
+        if check:
+            self.check(name)
+
+        started_at = self.clock()
+        try:
+            with span(name):
+                yield self
+        finally:
+            duration = self.clock() - started_at
+            self.stages[name] = self.stages.get(name, 0.0) + duration
+            stage_seconds.observe(duration, stage=name)
+            stage_budget_used.observe(duration / self.budget, stage=name)
+
+
+def current_deadline() -> Optional[Deadline]:
+    if not has_request_context():
+        return None
+    return g.get('deadline')
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Runs the enclosed block as a stage of the current request's deadline, if it has one.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        yield None
+    else:
+        with deadline.stage(name):
+            yield deadline
@@ -0,0 +1,164 @@
+"""
+Compiled exporters for Schematics models.
+
+`Model.serialize()` walks every field through the generic export loop, working out each field's export level
+and converter as it goes. Here that work is done once per model class instead: the field names, export levels
+and conversions are baked into a generated function, which is cached and reused for every instance.
+
+The output is the same as `serialize()`, with one difference: `serialize()` first validates the model, which
+converts any raw values assigned to its fields and applies defaults. The compiled exporter expects the model to
+already hold converted values, as it does when built from data, through `import_data`, or by assigning other
+models and primitive values.
+"""
+import itertools
+
+from typing import Callable, Dict, Type, List, Optional
+
+from schematics import Model
+from schematics.common import DROP, NONEMPTY, NOT_NONE, DEFAULT, PRIMITIVE
+from schematics.transforms import get_export_context, to_primitive_converter
+from schematics.types import BaseType, ModelType, ListType, DictType
+from schematics.undefined import Undefined
+
+_context = get_export_context(to_primitive_converter)
+
+_exporters: Dict[Type[Model], Callable[[Model], dict]] = {}
+
+
+def export(model: Model) -> dict:
+    """
+    Exports a model to primitive data, as `model.serialize()` would.
+    """
+    exporter = _exporters.get(type(model))
+    if exporter is None:
+        exporter = _exporters[type(model)] = compile_exporter(type(model))
+    return exporter(model)
+
+
+class _Compiler:
+    def __init__(self):
+        # Values referenced by the generated source
+        self.namespace = {'Undefined': Undefined, 'Model': Model, 'export': export}
+        self._names = itertools.count()
+
+    def bind(self, value) -> str:
+        name = f'_{next(self._names)}'
+        self.namespace[name] = value
+        return name
+
+    def value_expression(self, field: BaseType, value: str) -> str:
+        """
+        Returns an expression exporting the variable `value` as `field.export(value, PRIMITIVE, context)` would.
+        """
+        if isinstance(field, ModelType):
+            fallback = f'{self.bind(field.export)}({value}, {self.bind(PRIMITIVE)}, {self.bind(_context)})'
+            return f'(export({value}) if isinstance({value}, Model) else {fallback})'
+
+        if isinstance(field, (ListType, DictType)):
+            return f'{self.bind(self.compile_container(field))}({value})'
+
+        if not field.is_compound and type(field).to_primitive is BaseType.to_primitive:
+            return value
+
+        if not field.is_compound:
+            return f'{self.bind(field.to_primitive)}({value}, {self.bind(_context)})'
+
+        return f'{self.bind(field.export)}({value}, {self.bind(PRIMITIVE)}, {self.bind(_context)})'
+
+    def compile_container(self, field: BaseType) -> Callable:
+        item_field = field.field
+        level = item_field.get_export_level(_context)
+        is_list = isinstance(field, ListType)
+
+        lines = ['def export_container(value):']
+        if level == DROP:
+            lines.append('    return []' if is_list else '    return {}')
+        else:
+            item = self.value_expression(item_field, 'item')
+            # Unlike model fields, items are exported even if they are None
+            keep = self._keep_condition(item_field, level, 'shaped', may_be_none=True)
+
+            if keep is None:
+                if is_list:
+                    lines.append(f'    return [{item} for item in value]')
+                else:
+                    lines.append(f'    return {{key: {item} for key, item in value.items()}}')
+            else:
+                lines += [
+                    '    data = []' if is_list else '    data = {}',
+                    '    for item in value:' if is_list else '    for key, item in value.items():',
+                    f'        shaped = {item}',
+                    f'        if {keep}:',
+                    '            data.append(shaped)' if is_list else '            data[key] = shaped',
+                    '    return data',
+                ]
+
+        return self._compile(lines, 'export_container')
+
+    @staticmethod
+    def _keep_condition(field: BaseType, level, value: str, may_be_none: bool) -> Optional[str]:
+        """
+        Returns the condition under which an exported value is kept, or None if it is always kept.
+
+        `may_be_none` says whether the value may be None before it is exported. Exported models and
+        containers never are, and other types are assumed to only be None if they were to begin with.
+        """
+        conditions = []
+        if level <= NOT_NONE and may_be_none and not isinstance(field, (ModelType, ListType, DictType)):
+            conditions.append(f'{value} is not None')
+        if level <= NONEMPTY and field.is_compound:
+            conditions.append(f'len({value})')
+        return ' and '.join(conditions) or None
+
+    def _compile(self, lines: List[str], name: str) -> Callable:
+        exec('\n'.join(lines), self.namespace)
+        return self.namespace.pop(name)
+
+    def compile_model(self, model_class: Type[Model]) -> Callable[[Model], dict]:
+        lines = [
+            'def export_model(instance):',
+            # The model's data is a ChainMap, which is slow to look up in, so it is flattened first
+            '    maps = instance._data.maps',
+            '    values = {}',
+            '    for i in range(len(maps) - 1, -1, -1):',
+            '        values.update(maps[i])',
+            '    get = values.get',
+            '    data = {}',
+        ]
+
+        for name, field in model_class.fields.items():
+            level = field.get_export_level(_context)
+            if level == DROP:
+                continue
+            key = repr(field.serialized_name or name)
+
+            lines.append(f'    value = get({name!r}, Undefined)')
+            lines.append('    if value is Undefined:')
+            lines.append('        pass' if level <= DEFAULT else f'        data[{key}] = None')
+            lines.append('    elif value is None:')
+            lines.append('        pass' if level <= NOT_NONE else f'        data[{key}] = None')
+            lines.append('    else:')
+
+            expression = self.value_expression(field, 'value')
+            keep = self._keep_condition(field, level, 'value', may_be_none=False)
+
+            if keep is None:
+                lines.append(f'        data[{key}] = {expression}')
+            else:
+                lines.append(f'        value = {expression}')
+                lines.append(f'        if {keep}:')
+                lines.append(f'            data[{key}] = value')
+
+        lines.append('    return data')
+
+        return self._compile(lines, 'export_model')
+
+
+def compile_exporter(model_class: Type[Model]) -> Callable[[Model], dict]:
+    """
+    Generates a function exporting instances of `model_class` to primitive data.
+    """
+    assert not model_class._options.export_order and not model_class._serializables and \
+        not model_class._options.roles, f'{model_class.__name__} uses options the compiled exporter does not support'
+
+    return _Compiler().compile_model(model_class)
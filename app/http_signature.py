@@ -5,10 +5,13 @@ import logging
 import time
 import calendar
 
-from flask import request
+from flask import request, g
 from flask_httpauth import HTTPAuth
 from email.utils import parsedate
 
+from app.deadline import stage
+from app.tracing import span
+
 
 class HTTPSignatureAuth(HTTPAuth):
     def __init__(self, scheme='Signature', realm=None, required_headers=None, require_digest=True):
@@ -46,6 +49,10 @@ class HTTPSignatureAuth(HTTPAuth):
         return '\n'.join(result).encode()
 
     def authenticate(self, auth, _pw):
+        with stage('auth'):
+            return self._verify_signature(auth)
+
+    def _verify_signature(self, auth):
         # Get the current time as early as possible
         authentication_time = time.time()
 
@@ -79,7 +86,8 @@ class HTTPSignatureAuth(HTTPAuth):
                 logging.warning('Missing required header `digest` in signature.')
                 return False
 
-            encoded_digest = base64.b64encode(hashlib.sha256(request.data).digest()).decode()
+            with span('digest'):
+                encoded_digest = base64.b64encode(hashlib.sha256(request.data).digest()).decode()
 
             expected_digest = request.headers['digest']
             computed_digest = f'SHA-256={encoded_digest}'
@@ -108,9 +116,19 @@ class HTTPSignatureAuth(HTTPAuth):
             logging.warning(f'Unknown key ID `{sig_dict["keyId"]}` when verifying signature.')
             return False
 
-        computed_signature = hmac.new(key, bytes_to_sign, digestmod=hashlib.sha256).digest()
+        with span('signature', key_id=sig_dict['keyId']):
+            computed_signature = hmac.new(key, bytes_to_sign, digestmod=hashlib.sha256).digest()
+            signature_valid = hmac.compare_digest(expected_signature, computed_signature)
 
-        signature_valid = hmac.compare_digest(expected_signature, computed_signature)
         if not signature_valid:
             logging.warning(f'Signature on request does not match expected signature.')
+        else:
+            g.signature_key_id = sig_dict['keyId']
         return signature_valid
+
+    @staticmethod
+    def key_id():
+        """
+        Returns the key ID the current request was signed with, once it has been authenticated.
+        """
+        return g.get('signature_key_id')
@@ -0,0 +1,224 @@
+"""
+Results of recent checks by id, so checks PassFort retries after a timeout aren't run (and charged for) again.
+
+The exported response of each check is recorded under its integration key and id for `ttl` seconds. A
+check with an id that was already run is answered with the recorded response, and one with the id of a
+check still running waits for it to finish. Responses with retryable errors aren't recorded, so retrying
+those runs the check again.
+
+At most `max_entries` responses are kept in memory, dropping the oldest first. If `log_path` is set, they
+are also appended to that file as NDJSON by a background thread, off the request path, and read back from it
+on startup so they survive restarts. The log is compacted to the responses still recorded whenever it holds
+more than twice as many.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Optional, Callable, Dict, Tuple, List
+
+from app.api import ErrorType
+from app.deadline import DeadlineExceeded
+from app.metrics import Counter, Gauge
+
+idempotent_checks = Counter('idempotent_checks', 'Lookups of recorded check results by id, by outcome')
+idempotent_checks_recorded = Gauge('idempotent_checks_recorded', 'Check results currently recorded')
+
+_Key = Tuple[str, str]
+
+_STOP = object()
+
+
+def _recordable(response: dict) -> bool:
+    return not any(error.get('type') == ErrorType.PROVIDER_CONNECTION for error in response.get('errors', []))
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        ttl: float = 3600,
+        max_entries: int = 10000,
+        log_path: Optional[str] = None,
+        max_log_queue: int = 10000,
+        clock: Callable[[], float] = time.time
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.log_path = log_path
+        # Wall clock time, as it is compared with times recorded before a restart
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        # Recorded responses and when they were recorded, oldest first
+        self._entries: Dict[_Key, Tuple[float, dict]] = OrderedDict()
+        # Checks being run
+        self._pending: Dict[_Key, Future] = {}
+        self._log = None
+        self._logged = 0
+        # Lines waiting to be appended to the log
+        self._log_queue = queue.Queue(maxsize=max_log_queue)
+        self._thread = threading.Thread(target=self._run, name='idempotency-log', daemon=True)
+
+        if log_path is not None:
+            self._load()
+            self._compact()
+
+    def start(self) -> 'IdempotencyStore':
+        if self.log_path is not None:
+            self._thread.start()
+        return self
+
+    def close(self):
+        """
+        Writes out everything recorded so far and closes the log.
+        """
+        if self._thread.is_alive():
+            self._log_queue.put(_STOP)
+            self._thread.join()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def run(self, key_id: str, check_id: str, fn: Callable[[], dict], timeout: float) -> dict:
+        """
+        Returns the recorded response for `check_id`, or runs `fn` to produce it if there isn't one.
+
+        Raises DeadlineExceeded if the same check is already running, and doesn't finish within `timeout`
+        seconds.
+        """
+        key = (key_id, check_id)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                idempotent_checks.inc(outcome='hit')
+                return entry[1]
+
+            future = self._pending.get(key)
+            running = future is None
+            if running:
+                future = self._pending[key] = Future()
+
+        if not running:
+            idempotent_checks.inc(outcome='wait')
+            try:
+                return future.result(timeout)
+            except FutureTimeoutError:
+                raise DeadlineExceeded('duplicate')
+
+        idempotent_checks.inc(outcome='miss')
+        try:
+            response = fn()
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+
+        recordable = _recordable(response)
+        recorded_at = self.clock()
+        with self._lock:
+            del self._pending[key]
+            if recordable:
+                self._record(key, recorded_at, response)
+
+        future.set_result(response)
+        if recordable and self.log_path is not None:
+            self._append(key, recorded_at, response)
+        return response
+
+    def _record(self, key: _Key, recorded_at: float, response: dict):
+        self._entries[key] = (recorded_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            idempotent_checks.inc(outcome='evicted')
+        idempotent_checks_recorded.set(len(self._entries))
+
+    def _expire(self):
+        expire_before = self.clock() - self.ttl
+        while self._entries:
+            key, (recorded_at, _response) = next(iter(self._entries.items()))
+            if recorded_at > expire_before:
+                break
+            del self._entries[key]
+            idempotent_checks.inc(outcome='expired')
+        idempotent_checks_recorded.set(len(self._entries))
+
+    @staticmethod
+    def _line(key: _Key, recorded_at: float, response: dict) -> str:
+        key_id, check_id = key
+        record = {'key_id': key_id, 'id': check_id, 'recorded_at': recorded_at, 'response': response}
+        return json.dumps(record) + '\n'
+
+    def _load(self):
+        try:
+            with open(self.log_path, 'r') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                        self._record((record['key_id'], record['id']), record['recorded_at'], record['response'])
+                    except (ValueError, KeyError, TypeError):
+                        # Most likely the last line, if the process stopped part way through writing it
+                        logging.warning(f'Skipped unreadable line in {self.log_path}')
+        except FileNotFoundError:
+            pass
+        self._expire()
+
+    def _compact(self):
+        with self._lock:
+            entries = list(self._entries.items())
+
+        # Replaced in one step, so an interrupted compaction leaves the previous log intact
+        with open(f'{self.log_path}.tmp', 'w') as file:
+            for key, (recorded_at, response) in entries:
+                file.write(self._line(key, recorded_at, response))
+        os.replace(f'{self.log_path}.tmp', self.log_path)
+
+        if self._log is not None:
+            self._log.close()
+        self._log = open(self.log_path, 'a')
+        self._logged = len(entries)
+
+    def _append(self, key: _Key, recorded_at: float, response: dict):
+        try:
+            self._log_queue.put_nowait((key, recorded_at, response))
+        except queue.Full:
+            # Still recorded in memory, just won't survive a restart
+            idempotent_checks.inc(outcome='log_dropped')
+            logging.warning(f'Idempotency log queue full, dropped result for check {key[1]}')
+
+    def _write(self, batch: List[Tuple[_Key, float, dict]]):
+        self._log.write(''.join(self._line(*item) for item in batch))
+        self._log.flush()
+        self._logged += len(batch)
+        # Lines appended for responses that have since expired or been evicted no longer count
+        if self._logged > 2 * max(len(self._entries), 1):
+            self._compact()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._log_queue.get()]
+            while True:
+                try:
+                    batch.append(self._log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = any(item is _STOP for item in batch)
+            batch = [item for item in batch if item is not _STOP]
+
+            try:
+                if batch:
+                    self._write(batch)
+            except OSError:
+                idempotent_checks.inc(len(batch), outcome='log_failed')
+                logging.exception(f'Unable to write {len(batch)} results to {self.log_path}')
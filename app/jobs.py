@@ -0,0 +1,254 @@
+"""
+Queue of checks run in the background, for the asynchronous `ONE_TIME_CALLBACK` check template.
+
+`/checks` queues each check and answers straight away, and a pool of worker threads runs them. Results are
+kept for `result_ttl` seconds, or until there are more than `max_results`, for PassFort to poll. At most
+`max_queued` checks wait to be run; beyond that `submit` raises `QueueFull`.
+
+If `directory` is set, each queued check is also written there until it has run, so checks accepted by a
+worker that stops are run once it starts again. Credentials are never written, so recovered checks that
+need the provider are completed with an error asking for them to be retried instead.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Optional, Callable, Dict, Tuple
+
+from werkzeug.exceptions import HTTPException
+
+from app.api import RunCheckRequest, RunCheckResponse, Error
+from app.metrics import Counter, Gauge, Histogram
+
+check_jobs = Counter('check_jobs', 'Asynchronous checks, by outcome')
+check_jobs_queued = Gauge('check_jobs_queued', 'Asynchronous checks waiting for a worker')
+check_jobs_running = Gauge('check_jobs_running', 'Asynchronous checks being run')
+check_job_wait = Histogram('check_job_wait_seconds', 'Time asynchronous checks spend queued')
+
+QUEUED = 'QUEUED'
+RUNNING = 'RUNNING'
+COMPLETE = 'COMPLETE'
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    key_id: str
+    request: RunCheckRequest
+    state: str = QUEUED
+    queued_at: float = 0.0
+    completed_at: Optional[float] = None
+    response: Optional[RunCheckResponse] = None
+
+
+class JobQueue:
+    def __init__(
+        self,
+        run: Callable[[Job], RunCheckResponse],
+        workers: int = 8,
+        max_queued: int = 1000,
+        directory: Optional[str] = None,
+        result_ttl: float = 3600,
+        max_results: int = 10000,
+        on_complete: Optional[Callable[[Job], None]] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.run = run
+        self.max_queued = max_queued
+        self.directory = directory
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self.on_complete = on_complete
+        self.clock = clock
+
+        self._condition = threading.Condition()
+        # Every job still known, queued, running or complete, by key id and check id
+        self._jobs: Dict[Tuple[str, str], Job] = {}
+        # Complete jobs, in the order they completed, so the oldest expire first
+        self._completed: Dict[Tuple[str, str], Job] = OrderedDict()
+        self._queue = deque()
+        self._running = 0
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f'check-worker-{i}', daemon=True) for i in range(workers)
+        ]
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def start(self) -> 'JobQueue':
+        if self.directory is not None:
+            self._recover()
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Stops the workers once they finish the checks they are running. Checks still queued are run on the
+        next start, if they are persisted.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(timeout)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def submit(self, key_id: str, req: RunCheckRequest) -> Job:
+        """
+        Queues `req` to be run, unless a check with the same id was already submitted with the same key, in
+        which case that is returned instead.
+        """
+        check_id = str(req.id)
+        with self._condition:
+            self._expire()
+            existing = self._jobs.get((key_id, check_id))
+            if existing is not None:
+                check_jobs.inc(outcome='duplicate')
+                return existing
+
+            if len(self._queue) >= self.max_queued:
+                check_jobs.inc(outcome='rejected')
+                raise QueueFull(f'{len(self._queue)} checks are already queued')
+
+            job = Job(id=check_id, key_id=key_id, request=req, queued_at=self.clock())
+            if self.directory is not None:
+                self._persist(job)
+            self._enqueue(job)
+
+        check_jobs.inc(outcome='queued')
+        return job
+
+    def get(self, key_id: str, check_id: str) -> Optional[Job]:
+        """
+        Returns the job for `check_id`, if it was submitted with `key_id` and its result hasn't expired.
+        """
+        with self._condition:
+            self._expire()
+            return self._jobs.get((key_id, check_id))
+
+    def _enqueue(self, job: Job):
+        self._jobs[job.key_id, job.id] = job
+        self._queue.append(job)
+        check_jobs_queued.set(len(self._queue))
+        self._condition.notify()
+
+    def _expire(self):
+        now = self.clock()
+        while self._completed:
+            key, job = next(iter(self._completed.items()))
+            if len(self._completed) <= self.max_results and now - job.completed_at < self.result_ttl:
+                break
+            del self._completed[key]
+            del self._jobs[key]
+            check_jobs.inc(outcome='expired')
+
+    def _path(self, job: Job) -> str:
+        # Key ids are chosen by tenants, so aren't safe to use in file names as they are
+        name = hashlib.sha256(f'{job.key_id}\n{job.id}'.encode()).hexdigest()
+        return os.path.join(self.directory, f'{name}.json')
+
+    def _persist(self, job: Job):
+        request = job.request.to_primitive()
+        # Never persist credentials
+        request.pop('provider_credentials', None)
+
+        path = self._path(job)
+        # Replaced in one step, so a check is never recovered from a partly written file
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump({'key_id': job.key_id, 'request': request}, file)
+        os.replace(f'{path}.tmp', path)
+
+    def _recover(self):
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        # Oldest first, so they are run in the order they were submitted
+        for path in sorted((path for path in paths if path.endswith('.json')), key=os.path.getmtime):
+            try:
+                with open(path, 'r') as file:
+                    data = json.load(file)
+                req = RunCheckRequest().import_data(data['request'], apply_defaults=True)
+            except Exception:
+                logging.exception(f'Unable to recover queued check from {path}')
+                os.remove(path)
+                continue
+
+            job = Job(id=str(req.id), key_id=data['key_id'], request=req, queued_at=self.clock())
+            with self._condition:
+                if req.demo_result is None:
+                    self._complete(job, RunCheckResponse.error([Error.check_interrupted()]))
+                else:
+                    self._enqueue(job)
+            check_jobs.inc(outcome='recovered')
+
+    def _complete(self, job: Job, res: RunCheckResponse):
+        job.response = res
+        job.state = COMPLETE
+        job.completed_at = self.clock()
+        self._jobs[job.key_id, job.id] = self._completed[job.key_id, job.id] = job
+        if self.directory is not None:
+            try:
+                os.remove(self._path(job))
+            except FileNotFoundError:
+                pass
+
+    def _next(self) -> Optional[Job]:
+        with self._condition:
+            while not self._queue and not self._stopping:
+                self._condition.wait()
+            if self._stopping:
+                return None
+
+            job = self._queue.popleft()
+            job.state = RUNNING
+            self._running += 1
+            check_jobs_queued.set(len(self._queue))
+            check_jobs_running.set(self._running)
+
+        check_job_wait.observe(self.clock() - job.queued_at)
+        return job
+
+    def _work(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+
+            try:
+                res = self.run(job)
+                check_jobs.inc(outcome='completed')
+            except HTTPException as e:
+                # Such as an invalid demo result, which would fail again if retried
+                message = e.response.get_data(as_text=True) if e.response is not None else e.description
+                res = RunCheckResponse.error([Error.invalid_check_input(message)])
+                check_jobs.inc(outcome='invalid')
+            except Exception:
+                logging.exception(f'Unable to run check {job.id}')
+                res = RunCheckResponse.error([Error.check_interrupted()])
+                check_jobs.inc(outcome='failed')
+
+            with self._condition:
+                self._complete(job, res)
+                self._running -= 1
+                check_jobs_running.set(self._running)
+
+            if self.on_complete is not None:
+                try:
+                    self.on_complete(job)
+                except Exception:
+                    logging.exception(f'Completion callback failed for check {job.id}')
+
+            # Only needed to run the check, so not kept for as long as the result
+            job.request.provider_credentials = None
@@ -0,0 +1,194 @@
+"""
+Memory diagnostics for long-lived workers.
+
+When enabled, allocations are traced with `tracemalloc`, so the authenticated `/diagnostics/memory` endpoint
+can report where memory is held, grouped by module, and how that has changed since the worker started
+or since the last report, along with live instance counts for each schematics Model class. The change in
+traced memory over each request is exported as a histogram, and an optional background thread logs the
+largest changes periodically.
+
+Allocations are attributed to the most recent frame in this project's `app` package that led to them, so
+memory held by schematics on behalf of `app/api.py` is reported against `app/api.py`. This needs `frames` to
+be deep enough to reach back to it; the deeper it is, the more tracing costs.
+
+When disabled nothing is traced and no request hooks are installed, so it costs nothing.
+"""
+import functools
+import gc
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+
+from collections import Counter as CountOf
+from typing import Optional, List, Tuple
+
+from flask import Flask, g
+from schematics import Model
+
+from app.metrics import Gauge, Histogram
+
+memory_traced_bytes = Gauge('memory_traced_bytes', 'Memory currently allocated by Python, as traced')
+request_memory_growth = Histogram(
+    'request_memory_growth_bytes',
+    'Change in traced memory over each request. Includes allocations by concurrent requests.',
+    buckets=(0, 1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2)
+)
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+_APP_DIR = os.path.abspath(os.path.dirname(__file__)) + os.sep
+_LIBRARY_DIRS = sorted({os.path.abspath(path) for path in sys.path if path.endswith('-packages')}, key=len,
+                       reverse=True)
+
+# Allocations made by taking snapshots are not interesting. Skipped when grouping, as filtering every trace
+# of a snapshot up front takes far longer.
+_IGNORED_FILES = {tracemalloc.__file__, '<frozen importlib._bootstrap>', '<unknown>'}
+
+
+@functools.lru_cache(maxsize=None)
+def _module(filename: str) -> Tuple[str, bool]:
+    """
+    Returns `filename` relative to the project (e.g. `app/api.py`) or the library directory it is in, and
+    whether it is part of the `app` package.
+    """
+    path = os.path.abspath(filename)
+    for directory in [*_LIBRARY_DIRS, _ROOT]:
+        if path.startswith(directory + os.sep):
+            return os.path.relpath(path, directory), path.startswith(_APP_DIR)
+    return filename, False
+
+
+def _owner(traceback: tracemalloc.Traceback) -> Optional[str]:
+    """
+    Returns the module that owns allocations made at `traceback`, or None if they should be ignored.
+    """
+    if traceback[-1].filename in _IGNORED_FILES:
+        return None
+    # Frames run from oldest to most recent
+    for frame in reversed(traceback):
+        module, in_app = _module(frame.filename)
+        if in_app:
+            return module
+    return _module(traceback[-1].filename)[0]
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def model_counts() -> dict:
+    """
+    Returns the number of live instances of each Model class.
+    """
+    counts = CountOf(type(obj).__name__ for obj in gc.get_objects() if isinstance(obj, Model))
+    return dict(counts.most_common())
+
+
+class MemoryDiagnostics:
+    def __init__(self, enabled: bool = False, frames: int = 16, interval: Optional[float] = None, limit: int = 10):
+        self.enabled = enabled
+        self.frames = frames
+        self.interval = interval
+        self.limit = limit
+
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._last_report: Optional[tracemalloc.Snapshot] = None
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def init_app(self, app: Flask) -> 'MemoryDiagnostics':
+        """
+        Starts tracing, and installs the per-request hooks, if enabled.
+        """
+        if not self.enabled:
+            return self
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self._baseline = self._last_report = tracemalloc.take_snapshot()
+
+        app.before_request(self._request_started)
+        app.teardown_request(self._request_finished)
+
+        if self.interval is not None:
+            self._thread = threading.Thread(target=self._run, name='memory-diagnostics', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    @staticmethod
+    def _request_started():
+        g.traced_memory_at_start = tracemalloc.get_traced_memory()[0]
+
+    @staticmethod
+    def _request_finished(_exc):
+        started_with = g.get('traced_memory_at_start')
+        if started_with is not None:
+            current = tracemalloc.get_traced_memory()[0]
+            request_memory_growth.observe(current - started_with)
+            memory_traced_bytes.set(current)
+
+    @staticmethod
+    def _by_module(stats: List, limit: int) -> dict:
+        """
+        Groups statistics, or differences between them, by the module that owns them, as `{module: size}`
+        for the `limit` largest (or largest changes).
+        """
+        sizes = CountOf()
+        for stat in stats:
+            owner = _owner(stat.traceback)
+            if owner is not None:
+                sizes[owner] += getattr(stat, 'size_diff', stat.size)
+        largest = sorted(sizes.items(), key=lambda item: abs(item[1]), reverse=True)
+        return {module: size for module, size in largest[:limit] if size}
+
+    def _diff(self, snapshot: tracemalloc.Snapshot, since: tracemalloc.Snapshot, limit: int) -> dict:
+        return self._by_module(snapshot.compare_to(since, 'traceback'), limit)
+
+    def report(self, since: str = 'start', limit: Optional[int] = None) -> dict:
+        """
+        Returns where traced memory is held, and how it has changed since the worker started (`since='start'`),
+        or since the last report (`since='last'`).
+        """
+        assert self.enabled, 'Memory diagnostics are not enabled'
+        limit = limit or self.limit
+
+        snapshot = tracemalloc.take_snapshot()
+        with self._lock:
+            compare_to = self._last_report if since == 'last' else self._baseline
+            self._last_report = snapshot
+
+        current, peak = tracemalloc.get_traced_memory()
+        memory_traced_bytes.set(current)
+
+        return {
+            'rss_bytes': _rss_bytes(),
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'modules': self._by_module(snapshot.statistics('traceback'), limit),
+            'changes': self._diff(snapshot, compare_to, limit),
+            'since': since,
+            'models': model_counts(),
+        }
+
+    def _run(self):
+        previous = self._baseline
+        while not self._stopping.wait(self.interval):
+            snapshot = tracemalloc.take_snapshot()
+            changes = self._diff(snapshot, previous, self.limit)
+            previous = snapshot
+
+            current = tracemalloc.get_traced_memory()[0]
+            memory_traced_bytes.set(current)
+            summary = ''.join(f'\n    {size:+,} bytes: {module}' for module, size in changes.items())
+            logging.info(f'Traced memory is {current:,} bytes, largest changes since last report:{summary}')
@@ -0,0 +1,96 @@
+import bisect
+import threading
+
+from typing import Dict, Tuple, List, Sequence
+
+_registry: Dict[str, 'Metric'] = {}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(labels.items()))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, description: str):
+        assert name not in _registry, f'Metric `{name}` is already registered'
+
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry[name] = self
+
+    def _export_value(self, value):
+        return value
+
+    def export(self):
+        with self._lock:
+            values = [
+                {'labels': dict(key), 'value': self._export_value(value)}
+                for key, value in self._values.items()
+            ]
+        return {
+            'type': self.type,
+            'description': self.description,
+            'values': values,
+        }
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class _HistogramValue:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, num_buckets: int):
+        # The extra bucket counts observations above the largest bound
+        self.counts: List[int] = [0] * (num_buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str):
+        key = _label_key(labels)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = _HistogramValue(len(self.buckets))
+            histogram.counts[bisect.bisect_left(self.buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def _export_value(self, value: _HistogramValue):
+        return {
+            'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], value.counts)),
+            'sum': value.sum,
+            'count': value.count,
+        }
+
+
+def snapshot() -> Dict[str, dict]:
+    return {name: metric.export() for name, metric in sorted(_registry.items())}
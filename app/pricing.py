@@ -0,0 +1,91 @@
+import json
+
+from typing import Dict, Tuple, List, Optional
+
+from app.api import Charge, IndividualData
+
+ANY = '*'
+DEFAULT_SKU = 'NORMAL'
+
+
+def count_matched_databases(check_output: Optional[IndividualData]) -> int:
+    if check_output is None or check_output.electronic_id_check is None:
+        return 0
+    return sum(1 for match in check_output.electronic_id_check.matches or [] if match.count > 0)
+
+
+class PriceTable:
+    """
+    Prices for each SKU, by country and by the number of databases that matched.
+
+    Rows may use `*` for the country or the number of matched databases, and a match count above the
+    largest one priced uses the largest one's price. Wildcards are expanded when the table is built, so
+    pricing a check takes at most two dictionary lookups.
+    """
+
+    def __init__(self, base_charge: Optional[dict], prices: List[dict], maximum_cost: int):
+        self.base_charge = base_charge
+        self.maximum_cost = maximum_cost
+
+        rows = {(row['sku'], row['country'], row['matched_databases']): row['amount'] for row in prices}
+        self.max_matched_databases = max((count for _, _, count in rows if count != ANY), default=0)
+
+        skus = {sku for sku, _, _ in rows}
+        countries = {country for _, country, _ in rows} | {ANY}
+
+        self._index: Dict[Tuple[str, str, int], int] = {}
+        for sku in skus:
+            for country in countries:
+                for count in range(self.max_matched_databases + 1):
+                    # Most specific row first
+                    for key in (sku, country, count), (sku, country, ANY), (sku, ANY, count), (sku, ANY, ANY):
+                        if key in rows:
+                            self._index[(sku, country, count)] = rows[key]
+                            break
+
+        self._charges: Dict[Tuple[str, str, int], Tuple[dict, ...]] = {}
+
+    @staticmethod
+    def load(path: str, maximum_cost: int) -> 'PriceTable':
+        with open(path, 'r') as file:
+            table = json.load(file)
+        return PriceTable(table.get('base_charge'), table['prices'], maximum_cost)
+
+    def price(self, sku: str, country: str, matched_databases: int) -> Optional[int]:
+        count = min(matched_databases, self.max_matched_databases)
+        amount = self._index.get((sku, country, count))
+        if amount is None:
+            amount = self._index.get((sku, ANY, count))
+        return amount
+
+    def charge_data(self, country: str, matched_databases: int, sku: str = DEFAULT_SKU) -> Tuple[dict, ...]:
+        """
+        Returns the primitive charges for a check, reduced where necessary so they never total more than
+        `maximum_cost`. The result is shared between calls and must not be modified.
+        """
+        key = (sku, country, min(matched_databases, self.max_matched_databases))
+        charges = self._charges.get(key)
+        if charges is None:
+            charges = self._charges[key] = self._compute_charges(*key)
+        return charges
+
+    def charges(self, country: str, matched_databases: int, sku: str = DEFAULT_SKU) -> List[Charge]:
+        return [Charge(charge) for charge in self.charge_data(country, matched_databases, sku)]
+
+    def _compute_charges(self, sku: str, country: str, matched_databases: int) -> Tuple[dict, ...]:
+        charges = []
+        if self.base_charge is not None:
+            charges.append(dict(self.base_charge))
+
+        amount = self.price(sku, country, matched_databases)
+        if amount is not None:
+            charges.append({'amount': amount, 'sku': sku})
+
+        result = []
+        budget = self.maximum_cost
+        for charge in charges:
+            charge['amount'] = min(charge['amount'], budget)
+            budget -= charge['amount']
+            if charge['amount'] > 0:
+                result.append(charge)
+        return tuple(result)
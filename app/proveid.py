@@ -0,0 +1,127 @@
+"""
+Streaming parser for ProveID search responses.
+
+Responses list every database searched, and can be very large. Rather than building the whole document,
+the parser walks it with `iterparse`, turns each `Match` element into an `EkycMatch` as soon as it is
+complete and then discards it, so memory use does not grow with the size of the response.
+
+The subset of the response used is:
+
+    <Envelope>
+      <Body>
+        <SearchResponse>
+          <ProviderReference>...</ProviderReference>
+          <Matches>
+            <Match>
+              <DatabaseName>CAIS Active Lenders</DatabaseName>
+              <DatabaseType>CREDIT</DatabaseType>
+              <Count>1</Count>
+              <MatchedFields>
+                <Field>FORENAME</Field>
+                ...
+              </MatchedFields>
+              <DateFirstSeen>2010-04-01</DateFirstSeen>
+              <DateOfLastActivity>2019-11-20</DateOfLastActivity>
+            </Match>
+            ...
+          </Matches>
+        </SearchResponse>
+      </Body>
+    </Envelope>
+
+or a SOAP `Fault`. Namespaces are ignored.
+"""
+from typing import Union, BinaryIO, Optional, List, Iterator, Tuple
+from xml.etree.ElementTree import iterparse, Element
+
+from app.api import ElectronicIdCheck, EkycMatch, EkycDatabaseType, EkycMatchField
+from app.provider import ProviderMessageError, InvalidCredentialsError
+
+# Elements whose children are only read once the element itself is complete
+_KEEP_CHILDREN = {'Match', 'Fault'}
+
+_DATABASE_TYPES = set(EkycDatabaseType.choices)
+_MATCH_FIELDS = set(EkycMatchField.choices)
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child_text(elem: Element, name: str) -> Optional[str]:
+    for child in elem:
+        if _local_name(child.tag) == name:
+            return child.text.strip() if child.text else None
+    return None
+
+
+def _match_data(elem: Element) -> dict:
+    matched_fields: List[str] = []
+    for child in elem:
+        if _local_name(child.tag) == 'MatchedFields':
+            matched_fields = [field.text.strip() for field in child if field.text]
+
+    database_type = _child_text(elem, 'DatabaseType')
+    return {
+        'database_name': _child_text(elem, 'DatabaseName'),
+        'database_type': database_type if database_type in _DATABASE_TYPES else EkycDatabaseType.IGNORED,
+        'matched_fields': [field for field in matched_fields if field in _MATCH_FIELDS],
+        'count': int(_child_text(elem, 'Count') or 0),
+        'date_first_seen': _child_text(elem, 'DateFirstSeen'),
+        'date_of_last_activity': _child_text(elem, 'DateOfLastActivity'),
+    }
+
+
+def iter_search_response(source: Union[str, BinaryIO]) -> Iterator[Tuple[str, Union[str, dict]]]:
+    """
+    Yields `('provider_reference', str)` and `('match', dict)` items from a search response, as they are parsed
+    from a file name or binary file object (such as a streamed HTTP response body).
+
+    Raises InvalidCredentialsError or ProviderMessageError if the response is a SOAP fault.
+    """
+    # Open elements, so finished ones can be detached from their parent
+    stack: List[Element] = []
+    keep_depth = None
+
+    for event, elem in iterparse(source, events=('start', 'end')):
+        name = _local_name(elem.tag)
+
+        if event == 'start':
+            if name in _KEEP_CHILDREN and keep_depth is None:
+                keep_depth = len(stack)
+            stack.append(elem)
+            continue
+
+        stack.pop()
+
+        if keep_depth is not None:
+            if len(stack) > keep_depth:
+                continue
+            keep_depth = None
+
+        if name == 'Match':
+            yield 'match', _match_data(elem)
+        elif name == 'ProviderReference':
+            yield 'provider_reference', elem.text and elem.text.strip()
+        elif name == 'Fault':
+            fault_code = _child_text(elem, 'faultcode') or ''
+            fault_string = _child_text(elem, 'faultstring') or 'Unknown provider error'
+            if 'authenticat' in fault_code.lower() or 'authenticat' in fault_string.lower():
+                raise InvalidCredentialsError(fault_string)
+            raise ProviderMessageError(fault_string)
+
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+
+def parse_search_response(source: Union[str, BinaryIO]) -> ElectronicIdCheck:
+    result = ElectronicIdCheck({'matches': []})
+
+    for kind, value in iter_search_response(source):
+        if kind == 'match':
+            result.matches.append(EkycMatch(value))
+        else:
+            result.provider_reference_number = value
+
+    return result
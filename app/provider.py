@@ -0,0 +1,90 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from app.api import RunCheckRequest, RunCheckResponse, Error, ErrorType, ProviderCredentials
+
+if TYPE_CHECKING:
+    from app.checks import CheckInput
+
+
+class ProviderError(Exception):
+    # Whether the same request may succeed if it is sent again
+    retryable = False
+    error_type = ErrorType.PROVIDER_MESSAGE
+
+    def to_error(self) -> Error:
+        return Error({
+            'type': self.error_type,
+            'message': str(self),
+        })
+
+
+class ProviderConnectionError(ProviderError):
+    retryable = True
+    error_type = ErrorType.PROVIDER_CONNECTION
+
+
+class InvalidCredentialsError(ProviderError):
+    error_type = ErrorType.INVALID_CREDENTIALS
+
+
+class ProviderMessageError(ProviderError):
+    error_type = ErrorType.PROVIDER_MESSAGE
+
+
+@dataclass
+class ProviderSession:
+    """
+    An authenticated session with the provider, and anything derived from the credentials that is expensive
+    to prepare, such as parsed 2FA keys. Must not hold the credentials themselves.
+    """
+    token: object
+    # Seconds the session is valid for from when it was issued, or None if it does not expire
+    expires_in: Optional[float] = None
+    keys: object = None
+
+
+class ProviderClient(ABC):
+    @abstractmethod
+    def authenticate(self, credentials: ProviderCredentials, timeout: float) -> ProviderSession:
+        """
+        Authenticates with the provider, giving up after `timeout` seconds.
+
+        Raises InvalidCredentialsError if the credentials are rejected.
+        """
+
+    def refresh(self, session: ProviderSession, timeout: float) -> Optional[ProviderSession]:
+        """
+        Renews a session before it expires, without the original credentials. Returns None if the provider
+        does not support this.
+        """
+        return None
+
+    @abstractmethod
+    def run_check(
+        self,
+        check_input: 'CheckInput',
+        req: RunCheckRequest,
+        timeout: float,
+        session: Optional[ProviderSession] = None
+    ) -> RunCheckResponse:
+        """
+        Runs a live check against the provider, giving up after `timeout` seconds.
+
+        Raises a ProviderError if the provider could not produce a result.
+        """
+
+
+class UnsupportedProvider(ProviderClient):
+    def authenticate(self, credentials: ProviderCredentials, timeout: float) -> ProviderSession:
+        raise ProviderMessageError('Live checks are not supported')
+
+    def run_check(
+        self,
+        check_input: 'CheckInput',
+        req: RunCheckRequest,
+        timeout: float,
+        session: Optional[ProviderSession] = None
+    ) -> RunCheckResponse:
+        raise ProviderMessageError('Live checks are not supported')
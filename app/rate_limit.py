@@ -0,0 +1,183 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import wraps
+from typing import Dict, Tuple, Callable, Optional, List
+
+from flask import abort, Response
+
+
+@dataclass
+class RateLimit:
+    # Tokens added to the bucket per second
+    rate: float
+    # Maximum number of tokens the bucket can hold
+    burst: int
+    # Share of the provider slots given to this tenant when they are contended
+    weight: float = 1.0
+
+
+class RateLimitStore(ABC):
+    """
+    Holds the token bucket state for each tenant.
+
+    Only `take` needs implementing, and it must be atomic per key. This lets a store shared between
+    worker processes be swapped in for the default in-memory one.
+    """
+
+    @abstractmethod
+    def take(self, key: str, limit: RateLimit, now: float) -> float:
+        """
+        Takes a single token from the bucket for `key`.
+
+        Returns 0 if a token was available, otherwise the number of seconds until one will be.
+        """
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> (tokens, time last updated)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, key: str, limit: RateLimit, now: float) -> float:
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / limit.rate
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        store: RateLimitStore,
+        default: RateLimit,
+        limits: Optional[Dict[str, RateLimit]] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.store = store
+        self.default = default
+        self.limits = limits or {}
+        self.clock = clock
+
+    def limit_for(self, key: str) -> RateLimit:
+        return self.limits.get(key, self.default)
+
+    def check(self, key: str) -> float:
+        """
+        Returns the number of seconds the caller must wait before retrying, or 0 if the request is allowed.
+        """
+        return self.store.take(key, self.limit_for(key), self.clock())
+
+    def limited(self, key_fn: Callable[[], str]):
+        """
+        Rejects requests with a 429 once the tenant returned by `key_fn` has exhausted its bucket.
+        """
+
+        def decorator(fn):
+            @wraps(fn)
+            def wrapped_fn(*args, **kwargs):
+                retry_after = self.check(key_fn())
+                if retry_after > 0:
+                    abort(Response(
+                        'Too many requests',
+                        status=429,
+                        headers={'Retry-After': str(math.ceil(retry_after))}
+                    ))
+                return fn(*args, **kwargs)
+
+            return wrapped_fn
+
+        return decorator
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+class _Waiter:
+    __slots__ = ('start', 'event', 'cancelled')
+
+    def __init__(self, start: float):
+        self.start = start
+        self.event = threading.Event()
+        self.cancelled = False
+
+
+class FairScheduler:
+    """
+    Admits work from many tenants onto a fixed number of concurrent slots.
+
+    When every slot is busy, waiting work is admitted in weighted fair queueing order: each request is
+    tagged with a virtual finish time that advances by `1 / weight` per request from the same tenant,
+    so a tenant with a large backlog only delays its own requests.
+    """
+
+    def __init__(self, concurrency: int, weight_fn: Callable[[str], float] = lambda tenant: 1.0):
+        self.concurrency = concurrency
+        self.weight_fn = weight_fn
+
+        self._lock = threading.Lock()
+        self._available = concurrency
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._sequence = itertools.count()
+        self._waiting: List[Tuple[float, int, _Waiter]] = []
+
+    def acquire(self, tenant: str, timeout: Optional[float] = None) -> bool:
+        with self._lock:
+            start = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+            finish = start + 1 / self.weight_fn(tenant)
+            self._last_finish[tenant] = finish
+
+            # Slots are only freed once nobody is waiting, so anything still queued here has timed out
+            if self._available > 0:
+                self._waiting.clear()
+                self._available -= 1
+                self._virtual_time = start
+                return True
+
+            waiter = _Waiter(start)
+            heapq.heappush(self._waiting, (finish, next(self._sequence), waiter))
+
+        if waiter.event.wait(timeout):
+            return True
+
+        with self._lock:
+            # The slot may have been handed over between the wait timing out and taking the lock
+            if waiter.event.is_set():
+                return True
+            waiter.cancelled = True
+            return False
+
+    def release(self):
+        with self._lock:
+            while self._waiting:
+                _, _, waiter = heapq.heappop(self._waiting)
+                if waiter.cancelled:
+                    continue
+                self._virtual_time = waiter.start
+                waiter.event.set()
+                return
+            self._available += 1
+
+    @contextmanager
+    def slot(self, tenant: str, timeout: Optional[float] = None):
+        if not self.acquire(tenant, timeout):
+            raise SlotUnavailable(f'No provider slot available for `{tenant}`')
+        try:
+            yield
+        finally:
+            self.release()
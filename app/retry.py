@@ -0,0 +1,191 @@
+import math
+import random
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, Future
+from dataclasses import dataclass
+from typing import Optional, Callable, TYPE_CHECKING
+
+from app.api import RunCheckRequest, RunCheckResponse
+from app.deadline import Deadline
+from app.metrics import Counter, Histogram
+from app.provider import ProviderClient, ProviderError, ProviderSession, InvalidCredentialsError
+
+if TYPE_CHECKING:
+    from app.checks import CheckInput
+    from app.sessions import SessionCache
+
+provider_attempts = Counter('provider_attempts', 'Requests sent to the provider, by outcome')
+provider_hedges = Counter('provider_hedges', 'Hedged requests sent because the provider was slow to respond')
+provider_latency = Histogram('provider_latency_seconds', 'Latency of successful provider requests')
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 3
+    # Backoff before retry `n` is drawn uniformly from [0, min(max_delay, base_delay * 2^n)]
+    base_delay: float = 0.1
+    max_delay: float = 2.0
+    # Send a second request once the first has taken longer than this percentile of recent latencies.
+    # None disables hedging.
+    hedge_percentile: Optional[float] = 95
+    # Number of latencies that must be observed before hedging is enabled
+    min_hedge_samples: int = 20
+
+    def backoff(self, attempt: int, rand: Callable[[], float] = random.random) -> float:
+        return rand() * min(self.max_delay, self.base_delay * 2 ** attempt)
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def record(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, math.ceil(percentile / 100 * len(samples)) - 1)
+        return samples[max(0, index)]
+
+
+class RetryingProvider:
+    """
+    Wraps a provider client with retries and request hedging.
+
+    Connection errors are retried with jittered exponential backoff, while any other ProviderError is
+    returned immediately. Each attempt may be hedged by a second concurrent request once it is slower
+    than usual, and the first to succeed wins. Nothing is started once the deadline has run out.
+
+    If given `sessions`, requests with credentials are sent with a cached provider session.
+
+    The `executor` should have a worker for every provider request allowed in flight at once, plus room
+    for their hedges, so requests never queue behind abandoned ones.
+    """
+
+    def __init__(
+        self,
+        provider: ProviderClient,
+        policy: RetryPolicy,
+        executor: Optional[ThreadPoolExecutor] = None,
+        latencies: Optional[LatencyTracker] = None,
+        sleep: Callable[[float], None] = time.sleep,
+        sessions: Optional['SessionCache'] = None
+    ):
+        self.provider = provider
+        self.policy = policy
+        self.executor = executor or ThreadPoolExecutor(thread_name_prefix='provider')
+        self.latencies = latencies or LatencyTracker()
+        self.sleep = sleep
+        self.sessions = sessions
+
+    def _session(self, req: RunCheckRequest, deadline: Deadline) -> Optional[ProviderSession]:
+        if self.sessions is None or req.provider_credentials is None:
+            return None
+        deadline.check('provider')
+        return self.sessions.get(req.provider_credentials, timeout=deadline.remaining())
+
+    def run_check(self, check_input: 'CheckInput', req: RunCheckRequest, deadline: Deadline) -> RunCheckResponse:
+        for attempt in range(self.policy.max_attempts):
+            session = None
+            try:
+                session = self._session(req, deadline)
+                return self._hedged_call(check_input, req, deadline, session)
+            except ProviderError as e:
+                if isinstance(e, InvalidCredentialsError) and session is not None:
+                    # The session may have been revoked, so the next check authenticates again
+                    self.sessions.invalidate(req.provider_credentials)
+                if not e.retryable or attempt + 1 == self.policy.max_attempts:
+                    raise
+
+                delay = self.policy.backoff(attempt)
+                if delay >= deadline.remaining():
+                    raise
+                self.sleep(delay)
+
+    def _hedge_delay(self) -> Optional[float]:
+        if self.policy.hedge_percentile is None or len(self.latencies) < self.policy.min_hedge_samples:
+            return None
+        return self.latencies.percentile(self.policy.hedge_percentile)
+
+    def _call(
+        self,
+        check_input: 'CheckInput',
+        req: RunCheckRequest,
+        deadline: Deadline,
+        session: Optional[ProviderSession]
+    ) -> RunCheckResponse:
+        started_at = time.monotonic()
+        try:
+            result = self.provider.run_check(check_input, req, timeout=deadline.remaining(), session=session)
+        except ProviderError as e:
+            provider_attempts.inc(outcome=type(e).__name__)
+            raise
+
+        latency = time.monotonic() - started_at
+        self.latencies.record(latency)
+        provider_latency.observe(latency)
+        provider_attempts.inc(outcome='success')
+        return result
+
+    def _submit(
+        self,
+        check_input: 'CheckInput',
+        req: RunCheckRequest,
+        deadline: Deadline,
+        session: Optional[ProviderSession]
+    ) -> Future:
+        return self.executor.submit(self._call, check_input, req, deadline, session)
+
+    def _hedged_call(
+        self,
+        check_input: 'CheckInput',
+        req: RunCheckRequest,
+        deadline: Deadline,
+        session: Optional[ProviderSession]
+    ) -> RunCheckResponse:
+        deadline.check('provider')
+
+        pending = {self._submit(check_input, req, deadline, session)}
+        hedge_delay = self._hedge_delay()
+        error = None
+
+        try:
+            while pending:
+                remaining = deadline.remaining()
+                timeout = remaining if hedge_delay is None else min(hedge_delay, remaining)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    try:
+                        return future.result()
+                    except ProviderError as e:
+                        if not e.retryable:
+                            raise
+                        error = e
+
+                if not done:
+                    deadline.check('provider')
+                    if hedge_delay is not None:
+                        provider_hedges.inc()
+                        pending.add(self._submit(check_input, req, deadline, session))
+
+                # Only a single hedged request is sent per attempt
+                hedge_delay = None
+        finally:
+            # Requests that haven't started yet are abandoned rather than holding up other checks'. Those
+            # already sent can't be stopped, but are bounded by the deadline they were sent with.
+            for future in pending:
+                future.cancel()
+
+        raise error
@@ -0,0 +1,197 @@
+"""
+Cache of authenticated provider sessions, so live checks don't authenticate with the provider every time.
+
+Every check carries the tenant's full provider credentials. Sessions are cached under a keyed hash of them,
+and the credentials themselves are only used while authenticating, and never stored. Concurrent checks with
+the same credentials share a single authentication. Sessions close to expiring are renewed in the
+background, without the credentials, if the provider supports it. Otherwise they are dropped once expired,
+and the next check authenticates again. Sessions that go unused for `idle_timeout` are dropped, as are the
+least recently used once there are more than `max_sessions`.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict
+
+from app.api import ProviderCredentials
+from app.metrics import Counter, Gauge
+from app.provider import ProviderClient, ProviderSession, ProviderError, ProviderConnectionError
+
+provider_sessions = Counter('provider_sessions', 'Provider session lookups and maintenance, by outcome')
+provider_sessions_cached = Gauge('provider_sessions_cached', 'Provider sessions currently cached')
+
+
+class _Entry:
+    __slots__ = ('session', 'expires_at', 'last_used', 'refreshable')
+
+    def __init__(self, session: ProviderSession, now: float):
+        self.last_used = now
+        self.refreshable = True
+        self.renew(session, now)
+
+    def renew(self, session: ProviderSession, now: float):
+        self.session = session
+        self.expires_at = None if session.expires_in is None else now + session.expires_in
+
+    def expired(self, now: float) -> bool:
+        return self.expires_at is not None and now >= self.expires_at
+
+
+class SessionCache:
+    def __init__(
+        self,
+        provider: ProviderClient,
+        max_sessions: int = 1000,
+        idle_timeout: float = 900,
+        refresh_margin: float = 60,
+        refresh_timeout: float = 10,
+        sweep_interval: float = 5,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.provider = provider
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.refresh_margin = refresh_margin
+        self.refresh_timeout = refresh_timeout
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+
+        # Hashes can't be reversed, or checked against guessed credentials, without this
+        self._hash_key = os.urandom(32)
+        self._lock = threading.Lock()
+        self._entries: Dict[bytes, _Entry] = OrderedDict()
+        # Authentications in progress
+        self._pending: Dict[bytes, Future] = {}
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='provider-sessions', daemon=True)
+
+    def start(self) -> 'SessionCache':
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stopping.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _hash(self, credentials: ProviderCredentials) -> bytes:
+        message = json.dumps([
+            credentials.username,
+            credentials.password,
+            credentials.url,
+            credentials.public_key,
+            credentials.private_key,
+        ]).encode()
+        return hmac.new(self._hash_key, message, hashlib.sha256).digest()
+
+    def get(self, credentials: ProviderCredentials, timeout: float) -> ProviderSession:
+        """
+        Returns a session for `credentials`, authenticating with the provider if there isn't one cached.
+
+        Raises a ProviderError if authentication fails, or ProviderConnectionError if it takes longer than
+        `timeout` seconds.
+        """
+        key = self._hash(credentials)
+        now = self.clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not entry.expired(now):
+                entry.last_used = now
+                self._entries.move_to_end(key)
+                provider_sessions.inc(outcome='hit')
+                return entry.session
+
+            future = self._pending.get(key)
+            authenticating = future is None
+            if authenticating:
+                future = self._pending[key] = Future()
+
+        if not authenticating:
+            provider_sessions.inc(outcome='wait')
+            try:
+                return future.result(timeout)
+            except FutureTimeoutError:
+                raise ProviderConnectionError('Timed out waiting for provider authentication')
+
+        provider_sessions.inc(outcome='miss')
+        try:
+            session = self.provider.authenticate(credentials, timeout)
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._pending[key]
+            self._entries[key] = _Entry(session, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+                provider_sessions.inc(outcome='evicted')
+            provider_sessions_cached.set(len(self._entries))
+
+        future.set_result(session)
+        return session
+
+    def invalidate(self, credentials: ProviderCredentials):
+        """
+        Drops the session for `credentials`, such as once the provider no longer accepts it.
+        """
+        with self._lock:
+            if self._entries.pop(self._hash(credentials), None) is not None:
+                provider_sessions_cached.set(len(self._entries))
+
+    def sweep(self):
+        """
+        Drops idle and expired sessions, and renews those about to expire.
+        """
+        now = self.clock()
+        due = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if now - entry.last_used >= self.idle_timeout:
+                    del self._entries[key]
+                    provider_sessions.inc(outcome='idle')
+                elif entry.expired(now):
+                    del self._entries[key]
+                    provider_sessions.inc(outcome='expired')
+                elif entry.refreshable and entry.expires_at is not None and \
+                        entry.expires_at - now <= self.refresh_margin:
+                    due.append(entry)
+            provider_sessions_cached.set(len(self._entries))
+
+        for entry in due:
+            try:
+                session = self.provider.refresh(entry.session, self.refresh_timeout)
+            except ProviderError as e:
+                # Tried again on the next sweep, until it expires
+                logging.warning(f'Unable to refresh provider session: {e}')
+                provider_sessions.inc(outcome='refresh_failed')
+                continue
+
+            if session is None:
+                entry.refreshable = False
+                continue
+
+            with self._lock:
+                entry.renew(session, self.clock())
+            provider_sessions.inc(outcome='refreshed')
+
+    def _run(self):
+        while not self._stopping.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                logging.exception('Unable to maintain provider sessions')
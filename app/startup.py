@@ -1,6 +1,7 @@
 # This file is mocked out for testing (see `tests/conftest.py`)
 
 import base64
+import json
 import os
 import sys
 import logging
@@ -19,4 +20,74 @@ integration_key_store = {
     _integration_secret_key[:8]: base64.b64decode(_integration_secret_key)
 }
 
+# Token bucket applied to `/checks` for each integration key, and its share of the provider slots
+default_tenant_limit = {
+    'rate': float(os.environ.get('RATE_LIMIT_RATE', '20')),
+    'burst': int(os.environ.get('RATE_LIMIT_BURST', '40')),
+    'weight': 1.0,
+}
+
+# Overrides for individual integration keys, e.g. '{"abcd1234": {"rate": 50, "burst": 100, "weight": 2}}'
+tenant_limits = json.loads(os.environ.get('TENANT_LIMITS', '{}'))
+
+# Maximum number of live provider requests in flight at once, and how long to queue for one
+provider_concurrency = int(os.environ.get('PROVIDER_CONCURRENCY', '8'))
+provider_queue_timeout = float(os.environ.get('PROVIDER_QUEUE_TIMEOUT', '10'))
+# Seconds of the check timeout reserved for the response to reach PassFort
+deadline_safety_margin = float(os.environ.get('DEADLINE_SAFETY_MARGIN', '2'))
+# Retries and hedging of live provider requests (see `app.retry.RetryPolicy`)
+provider_retry_policy = {
+    'max_attempts': int(os.environ.get('PROVIDER_MAX_ATTEMPTS', '3')),
+    'hedge_percentile': float(os.environ['PROVIDER_HEDGE_PERCENTILE']) if os.environ.get('PROVIDER_HEDGE_PERCENTILE')
+    else None,
+}
+# Cache of authenticated provider sessions, shared by checks with the same credentials
+provider_session_cache = {
+    'max_sessions': int(os.environ.get('PROVIDER_SESSION_CACHE_SIZE', '1000')),
+    'idle_timeout': float(os.environ.get('PROVIDER_SESSION_IDLE_TIMEOUT', '900')),
+    'refresh_margin': float(os.environ.get('PROVIDER_SESSION_REFRESH_MARGIN', '60')),
+}
+# How `/checks` runs checks: 'sync' answers with the result, 'async' queues them for PassFort to poll (see
+# `app.jobs`)
+check_mode = os.environ.get('CHECK_MODE', 'sync')
+async_checks = {
+    'workers': int(os.environ.get('ASYNC_CHECK_WORKERS', '8')),
+    'max_queued': int(os.environ.get('ASYNC_CHECK_QUEUE_SIZE', '1000')),
+    'directory': os.environ.get('ASYNC_CHECK_DIRECTORY'),
+    'result_ttl': float(os.environ.get('ASYNC_CHECK_RESULT_TTL', '3600')),
+}
+# Seconds a queued check may take once it starts running
+async_check_timeout = float(os.environ.get('ASYNC_CHECK_TIMEOUT', '60'))
+# Results of checks recorded by id, so checks PassFort retries aren't run again (see `app.idempotency`)
+idempotency = {
+    'ttl': float(os.environ.get('IDEMPOTENCY_TTL', '3600')),
+    'max_entries': int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', '10000')),
+    'log_path': os.environ.get('IDEMPOTENCY_LOG'),
+}
+# Directory that every check result is written to for auditing. Auditing is disabled if unset.
+audit_directory = os.environ.get('AUDIT_DIRECTORY')
+# What to do when results are produced faster than they can be written: 'block' or 'drop'
+audit_policy = os.environ.get('AUDIT_POLICY', 'block')
+# Dynamic responses smaller than `min_size` bytes are sent uncompressed
+response_compression = {
+    'min_size': int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    'levels': {
+        'gzip': int(os.environ.get('COMPRESSION_GZIP_LEVEL', '1')),
+        'br': int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '1')),
+    },
+}
+# File that sampled and slow request traces are appended to. Tracing is disabled if unset.
+trace_file = os.environ.get('TRACE_FILE')
+# Fraction of requests traced, unless the caller's `traceparent` says otherwise
+trace_sample_rate = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+# Requests taking at least this many seconds are traced whether or not they were sampled
+trace_slow_threshold = float(os.environ['TRACE_SLOW_THRESHOLD']) if os.environ.get('TRACE_SLOW_THRESHOLD') else None
+# Tracing of memory allocations, reported by `/diagnostics/memory` (see `app.memory`). Slows down every
+# allocation while enabled, more so the more frames are kept.
+memory_diagnostics = {
+    'enabled': os.environ.get('MEMORY_DIAGNOSTICS', '').lower() in {'1', 'true', 'yes'},
+    'frames': int(os.environ.get('MEMORY_TRACE_FRAMES', '16')),
+    'interval': float(os.environ['MEMORY_REPORT_INTERVAL']) if os.environ.get('MEMORY_REPORT_INTERVAL') else None,
+}
+
 logging.basicConfig(level=os.environ.get('LOGLEVEL', 'INFO'))
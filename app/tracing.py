@@ -0,0 +1,247 @@
+"""
+Lightweight span-based tracing.
+
+Each request is a trace, made up of nested spans (signature verification, validation, the provider, ...).
+Spans are kept with their trace until the request completes, so attributes learned part way through, such
+as the check id, are applied to every span, and the whole trace can be kept if the request was slow.
+
+Traces continue any W3C `traceparent` sent with the request, keeping the caller's sampling decision.
+Otherwise they are sampled at `sample_rate`. Kept traces are written by a background thread, as one JSON
+object per span per line, and are dropped rather than slowing requests down if it falls behind.
+"""
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, List, Callable
+
+from app.metrics import Counter
+
+trace_spans = Counter('trace_spans', 'Spans handled by the trace exporter, by outcome')
+
+_TRACEPARENT = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+_SAMPLED = 0x01
+
+_STOP = object()
+
+
+def _new_id(bits: int) -> str:
+    return f'{random.getrandbits(bits):0{bits // 4}x}'
+
+
+class Trace:
+    def __init__(self, trace_id: str, sampled: bool, parent_span_id: Optional[str] = None):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.parent_span_id = parent_span_id
+        self.attributes: Dict[str, object] = {}
+        self.spans: List['Span'] = []
+
+    @classmethod
+    def from_traceparent(cls, traceparent: Optional[str]) -> Optional['Trace']:
+        """
+        Returns the trace described by a W3C `traceparent` header, or None if it is missing or invalid.
+        """
+        match = _TRACEPARENT.match((traceparent or '').strip().lower())
+        if match is None:
+            return None
+
+        version, trace_id, parent_span_id, flags = match.groups()
+        if version == 'ff' or trace_id == '0' * 32 or parent_span_id == '0' * 16:
+            return None
+
+        return cls(trace_id, bool(int(flags, 16) & _SAMPLED), parent_span_id)
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attributes', 'start_time', '_started_at', 'duration')
+
+    def __init__(self, trace: Trace, parent_id: Optional[str], name: str, attributes: Dict[str, object]):
+        self.trace = trace
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_time = time.time()
+        self._started_at = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self):
+        self.duration = time.perf_counter() - self._started_at
+        self.trace.spans.append(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f'00-{self.trace.trace_id}-{self.span_id}-{_SAMPLED if self.trace.sampled else 0:02x}'
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'duration_ms': self.duration * 1000,
+            'attributes': {**self.trace.attributes, **self.attributes},
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+class FileSpanExporter:
+    """
+    Appends spans to a file as NDJSON, in batches, from a background thread.
+    """
+
+    def __init__(self, path: str, max_queue: int = 10000, batch_size: int = 500, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+
+    def start(self) -> 'FileSpanExporter':
+        self._thread.start()
+        return self
+
+    def export(self, spans: List[Span]):
+        for span in spans:
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                trace_spans.inc(outcome='dropped')
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Writes out everything queued so far.
+        """
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _write(self, batch: List[Span]):
+        lines = ''.join(json.dumps(span.to_dict(), default=str) + '\n' for span in batch)
+        with open(self.path, 'a') as file:
+            file.write(lines)
+        trace_spans.inc(len(batch), outcome='written')
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            batch_deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, batch_deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except OSError:
+                logging.exception(f'Unable to write {len(batch)} spans')
+                trace_spans.inc(len(batch), outcome='failed')
+
+
+class Tracer:
+    """
+    Starts traces and records their spans.
+
+    Traces that are not sampled are still recorded if `slow_threshold` is set, and kept if their root span
+    takes at least that many seconds. Otherwise spans are not recorded for them at all.
+    """
+
+    def __init__(
+        self,
+        exporter: Optional[FileSpanExporter],
+        sample_rate: float = 0.0,
+        slow_threshold: Optional[float] = None,
+        rand: Callable[[], float] = random.random
+    ):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.rand = rand
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes) -> Optional[Span]:
+        """
+        Starts a trace with a root span, which becomes the current span. Returns None if it is not recorded.
+        """
+        if self.exporter is None:
+            return None
+
+        trace = Trace.from_traceparent(traceparent)
+        if trace is None:
+            trace = Trace(_new_id(128), self.rand() < self.sample_rate)
+
+        if not trace.sampled and self.slow_threshold is None:
+            return None
+
+        span = Span(trace, trace.parent_span_id, name, attributes)
+        _current_span.set(span)
+        return span
+
+    def end_trace(self, span: Optional[Span]):
+        """
+        Ends the root span of a trace, and exports the trace if it is to be kept.
+        """
+        if span is None:
+            return
+        _current_span.set(None)
+
+        span.end()
+        slow = self.slow_threshold is not None and span.duration >= self.slow_threshold
+        if span.trace.sampled or slow:
+            self.exporter.export(span.trace.spans)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Runs the enclosed block as a child of the current span, if a trace is being recorded.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(parent.trace, parent.span_id, name, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.set_attribute('error', type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def tag_trace(**attributes):
+    """
+    Adds attributes to every span of the current trace, including those already ended.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.trace.attributes.update(attributes)
@@ -0,0 +1,17 @@
+import time
+
+from typing import Callable
+
+
+def measure(name: str, fn: Callable[[], object], number: int) -> float:
+    """
+    Calls `fn` `number` times, printing and returning the rate in calls per second.
+    """
+    started_at = time.perf_counter()
+    for _ in range(number):
+        fn()
+    elapsed = time.perf_counter() - started_at
+
+    rate = number / elapsed
+    print(f'{name}: {rate:,.0f}/s ({elapsed / number * 1e6:.2f}us each)')
+    return rate
@@ -0,0 +1,40 @@
+"""
+CPU time against bytes saved when compressing responses, for each encoding and level.
+
+    python -m benchmarks.compression
+"""
+import json
+import os
+
+from app.compression import ENCODINGS, compress, GZIP, BROTLI
+from app.export import export
+from benchmarks import measure
+from benchmarks.export import build_response
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), '../static')
+
+LEVELS = {GZIP: (1, 4, 6, 9), BROTLI: (1, 4, 6, 9, 11)}
+
+
+def _payloads():
+    with open(os.path.join(STATIC_DIR, 'config.json'), 'rb') as file:
+        yield 'config', file.read()
+    with open(os.path.join(STATIC_DIR, 'demo_results/GBR_TWO_NAME_ADDRESS_MATCHES.json'), 'rb') as file:
+        yield 'demo result', file.read()
+    for matches in 10, 100, 1000:
+        yield f'{matches} matches', json.dumps(export(build_response(matches))).encode()
+
+
+def main():
+    for name, data in _payloads():
+        print(f'{name}: {len(data):,} bytes')
+        for encoding in ENCODINGS:
+            for level in LEVELS[encoding]:
+                encoded = compress(data, encoding, level)
+                number = max(3, 1_000_000 // len(data))
+                measure(f'  {encoding} {level:>2} -> {len(encoded):>7,} bytes ({len(encoded) / len(data):.1%})',
+                        lambda: compress(data, encoding, level), number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Cost of exporting check responses, through `serialize()` and the compiled exporter, as the number of
+matches grows.
+
+    python -m benchmarks.export
+"""
+from app.api import RunCheckResponse
+from app.export import export
+from benchmarks import measure
+
+
+def build_response(matches: int) -> RunCheckResponse:
+    return RunCheckResponse().import_data({
+        'check_output': {
+            'entity_type': 'INDIVIDUAL',
+            'personal_details': {
+                'name': {'given_names': ['Henry'], 'family_name': 'Gnarglefoot'},
+                'dob': '1990-01-01',
+            },
+            'address_history': [
+                {'address': {'type': 'STRUCTURED', 'country': 'GBR', 'postal_code': 'AB1 2CD'}},
+            ],
+            'electronic_id_check': {
+                'provider_reference_number': 'REF',
+                'matches': [
+                    {
+                        'database_name': f'Database {i}',
+                        'database_type': 'CREDIT',
+                        'matched_fields': ['FORENAME', 'SURNAME', 'ADDRESS'],
+                        'count': 1,
+                        'date_first_seen': '2010-04-01',
+                    }
+                    for i in range(matches)
+                ],
+            },
+        },
+        'errors': [],
+        'warnings': [],
+        'charges': [{'amount': 100, 'reference': 'REF'}, {'amount': 50, 'sku': 'NORMAL'}],
+    }, apply_defaults=True)
+
+
+def main():
+    for matches in 10, 100, 1000:
+        res = build_response(matches)
+        assert export(res) == res.serialize()
+
+        number = 100_000 // matches
+        measure(f'serialize, {matches} matches', res.serialize, number)
+        measure(f'export, {matches} matches', lambda: export(res), number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+Open-loop load generator for `/checks`.
+
+Sends signed demo checks at a fixed rate, regardless of how quickly they are answered, and reports
+throughput and latency percentiles. Every check has its own `id`, as the service answers repeated ids from
+its idempotency store without running the check. Latency is measured from when each request was due to be sent,
+so a service that falls behind is not flattered by the generator slowing down with it.
+
+Against a running service:
+
+    python -m benchmarks.loadgen --url http://127.0.0.1:8080 --rate 200 --duration 30
+
+Or against the app in this process, without any network:
+
+    python -m benchmarks.loadgen --in-process --rate 200 --duration 30
+
+The signing key defaults to the one the service uses, from `INTEGRATION_SECRET_KEY`.
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import math
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from typing import List, Sequence, Callable, Dict
+from uuid import uuid4
+
+CHECKS_PATH = '/checks'
+
+
+@dataclass
+class PreparedRequest:
+    body: bytes
+    digest: str
+
+
+@dataclass
+class Report:
+    duration: float
+    latencies: List[float]
+    statuses: Dict[int, int] = field(default_factory=dict)
+    errors: int = 0
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.duration
+
+    def percentile(self, percentile: float) -> float:
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return math.nan
+        return latencies[min(len(latencies) - 1, max(0, math.ceil(percentile / 100 * len(latencies)) - 1))]
+
+    def summary(self) -> str:
+        lines = [
+            f'requests:   {len(self.latencies)} in {self.duration:.1f}s ({self.throughput:,.1f}/s)',
+            f'statuses:   {dict(sorted(self.statuses.items()))}',
+            f'errors:     {self.errors}',
+        ]
+        for percentile in 50, 95, 99, 99.9:
+            lines.append(f'p{percentile:<9}{self.percentile(percentile) * 1000:.2f}ms')
+        return '\n'.join(lines)
+
+
+def build_check_request(country: str, demo_result: str, address_history_length: int) -> dict:
+    return {
+        'id': str(uuid4()),
+        'demo_result': demo_result,
+        'commercial_relationship': 'DIRECT',
+        'check_input': {
+            'entity_type': 'INDIVIDUAL',
+            'personal_details': {
+                'name': {
+                    'given_names': ['Henry'],
+                    'family_name': 'Gnarglefoot'
+                },
+                'dob': '1990-01-01'
+            },
+            'address_history': [
+                {
+                    'address': {
+                        'type': 'STRUCTURED',
+                        'country': country,
+                        'postal_code': f'AB{i} 1CD',
+                        'locality': 'London',
+                        'route': 'Test Street',
+                        'street_number': str(i + 1),
+                    },
+                }
+                for i in range(address_history_length)
+            ]
+        },
+        'provider_config': {
+            'require_dob': False,
+            'mortality_check': True,
+            'requires_address_on_all_matches': False,
+            'run_original_address': False,
+        },
+    }
+
+
+def prepare_requests(
+    countries: Sequence[str],
+    demo_results: Sequence[str],
+    address_history_lengths: Sequence[int],
+    count: int
+) -> List[PreparedRequest]:
+    """
+    Serializes and digests `count` requests, each with its own `id`, cycling through every combination of
+    template values.
+    """
+    templates = itertools.cycle(itertools.product(countries, demo_results, address_history_lengths))
+    prepared = []
+    for country, demo_result, length in itertools.islice(templates, count):
+        body = json.dumps(build_check_request(country, demo_result, length)).encode()
+        digest = 'SHA-256=' + base64.b64encode(hashlib.sha256(body).digest()).decode()
+        prepared.append(PreparedRequest(body, digest))
+    return prepared
+
+
+class Signer:
+    def __init__(self, key_id: str, key: bytes):
+        self.key_id = key_id
+        self.key = key
+
+    def headers(self, path: str, digest: str) -> Dict[str, str]:
+        date = formatdate(usegmt=True)
+        signed = f'(request-target): post {path}\ndate: {date}\ndigest: {digest}'.encode()
+        signature = base64.b64encode(hmac.new(self.key, signed, digestmod=hashlib.sha256).digest()).decode()
+        return {
+            'Date': date,
+            'Digest': digest,
+            'Content-Type': 'application/json',
+            'Authorization': f'Signature keyId="{self.key_id}",algorithm="hmac-sha256",'
+                             f'headers="(request-target) date digest",signature="{signature}"',
+        }
+
+
+# Sends a request and returns its status code
+Send = Callable[[bytes, Dict[str, str]], int]
+
+
+def http_target(base_url: str) -> Callable[[], Send]:
+    import requests
+
+    def connect() -> Send:
+        session = requests.Session()
+        url = base_url.rstrip('/') + CHECKS_PATH
+        return lambda body, headers: session.post(url, data=body, headers=headers).status_code
+
+    return connect
+
+
+def app_target(app) -> Callable[[], Send]:
+    def connect() -> Send:
+        client = app.test_client()
+        return lambda body, headers: client.post(CHECKS_PATH, data=body, headers=headers).status_code
+
+    return connect
+
+
+def run(
+    connect: Callable[[], Send],
+    signer: Signer,
+    prepared: Sequence[PreparedRequest],
+    rate: float,
+    duration: float,
+    concurrency: int
+) -> Report:
+    """
+    Sends `rate` requests per second for `duration` seconds over `concurrency` connections, each of the
+    `prepared` requests at most once.
+    """
+    connections = threading.local()
+    lock = threading.Lock()
+    report = Report(duration=duration, latencies=[])
+
+    def send(request: PreparedRequest, due_at: float):
+        if not hasattr(connections, 'send'):
+            connections.send = connect()
+        try:
+            status = connections.send(request.body, signer.headers(CHECKS_PATH, request.digest))
+        except Exception:
+            status = None
+        latency = time.perf_counter() - due_at
+
+        with lock:
+            report.latencies.append(latency)
+            if status is None:
+                report.errors += 1
+            else:
+                report.statuses[status] = report.statuses.get(status, 0) + 1
+                if status != 200:
+                    report.errors += 1
+
+    total = int(rate * duration)
+    # Sending a request again would only measure the idempotency store
+    if len(prepared) < total:
+        raise ValueError(f'{total} requests are needed, but only {len(prepared)} were prepared')
+    requests = iter(prepared)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started_at = time.perf_counter()
+        for i in range(total):
+            due_at = started_at + i / rate
+            delay = due_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, next(requests), due_at)
+
+    report.duration = time.perf_counter() - started_at
+    return report
+
+
+def _list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Open-loop load generator for /checks')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='Base URL of a running service')
+    target.add_argument('--in-process', action='store_true', help='Drive the app in this process')
+    parser.add_argument('--rate', type=float, default=100, help='Requests per second')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to send requests for')
+    parser.add_argument('--concurrency', type=int, default=64, help='Number of concurrent connections')
+    parser.add_argument('--countries', type=_list, default=['GBR', 'USA'])
+    parser.add_argument('--demo-results', type=_list, default=['NO_MATCHES', 'ONE_NAME_ADDRESS_MATCH'])
+    parser.add_argument('--address-history', type=lambda value: [int(i) for i in _list(value)], default=[1, 3],
+                        help='Comma separated address history lengths')
+    parser.add_argument('--secret-key', default=os.environ.get('INTEGRATION_SECRET_KEY'),
+                        help='Base64 encoded signing key, as given to the service')
+    args = parser.parse_args()
+
+    if not args.secret_key:
+        parser.error('--secret-key or INTEGRATION_SECRET_KEY is required')
+    signer = Signer(args.secret_key[:8], base64.b64decode(args.secret_key))
+
+    if args.in_process:
+        from main import app
+        connect = app_target(app)
+    else:
+        connect = http_target(args.url)
+
+    prepared = prepare_requests(args.countries, args.demo_results, args.address_history,
+                                count=int(args.rate * args.duration))
+    report = run(connect, signer, prepared, args.rate, args.duration, args.concurrency)
+    print(report.summary())
+
+
+if __name__ == '__main__':
+    main()
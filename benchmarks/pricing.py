@@ -0,0 +1,35 @@
+"""
+Throughput of pricing checks, as when backfilling charges for stored results.
+
+    python -m benchmarks.pricing
+"""
+import os
+import random
+
+from app.pricing import PriceTable
+from benchmarks import measure
+
+COUNTRIES = ['GBR', 'USA', 'CAN', 'NLD', 'FRA']
+
+
+def main():
+    table = PriceTable.load(
+        os.path.join(os.path.dirname(__file__), '../static/pricing.json'),
+        maximum_cost=200
+    )
+
+    rng = random.Random(0)
+    checks = [(rng.choice(COUNTRIES), rng.randrange(10)) for _ in range(100_000)]
+    checks_iter = iter(checks * 10)
+
+    measure('price lookup', lambda: table.price('NORMAL', *next(checks_iter)), 1_000_000)
+
+    checks_iter = iter(checks * 10)
+    measure('charge data', lambda: table.charge_data(*next(checks_iter)), 1_000_000)
+
+    checks_iter = iter(checks)
+    measure('charge models', lambda: table.charges(*next(checks_iter)), 100_000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Time and peak memory of extracting the matches from large ProveID search responses, streaming versus
+building the whole document first, and the time taken to also build the `EkycMatch` models.
+
+    python -m benchmarks.proveid_parser
+"""
+import io
+import random
+import time
+import tracemalloc
+
+from typing import Callable
+from xml.etree import ElementTree
+
+from app.proveid import parse_search_response, iter_search_response, _match_data, _local_name
+
+DATABASES = [
+    ('CAIS Active Lenders', 'CREDIT'),
+    ('CAIS Settled Accounts', 'CREDIT'),
+    ('Active or Settled CCJs', 'CREDIT'),
+    ('Telephone Directory', 'CIVIL'),
+    ('Electoral Roll', 'CIVIL'),
+    ('Mortality List', 'MORTALITY'),
+]
+
+FIELDS = ['FORENAME', 'SURNAME', 'ADDRESS', 'DOB']
+
+
+def synthetic_response(num_matches: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    parts = [
+        '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+        '<soap:Body><SearchResponse xmlns="http://xml.proveid.experian.com/">'
+        '<ProviderReference>REF-123456</ProviderReference><Matches>'
+    ]
+    for _ in range(num_matches):
+        name, database_type = rng.choice(DATABASES)
+        fields = ''.join(f'<Field>{field}</Field>' for field in FIELDS if rng.random() < 0.5)
+        parts.append(
+            f'<Match><DatabaseName>{name}</DatabaseName><DatabaseType>{database_type}</DatabaseType>'
+            f'<Count>{rng.randrange(3)}</Count><MatchedFields>{fields}</MatchedFields>'
+            f'<DateFirstSeen>2010-04-01</DateFirstSeen><DateOfLastActivity>2019-11-20</DateOfLastActivity>'
+            f'</Match>'
+        )
+    parts.append('</Matches></SearchResponse></soap:Body></soap:Envelope>')
+    return ''.join(parts).encode()
+
+
+def stream_matches(source):
+    return [value for kind, value in iter_search_response(source) if kind == 'match']
+
+
+def whole_document_matches(source):
+    root = ElementTree.parse(source).getroot()
+    return [_match_data(elem) for elem in root.iter() if _local_name(elem.tag) == 'Match']
+
+
+def _measure(name: str, fn: Callable[[], object], memory: bool = True):
+    started_at = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started_at
+
+    if not memory:
+        print(f'{name}: {elapsed:.2f}s')
+        return
+
+    # Measured separately, as tracing allocations slows everything down
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name}: {elapsed:.2f}s, peak {peak / 1024 / 1024:.1f}MiB')
+
+
+def main():
+    for num_matches in 1_000, 10_000, 100_000:
+        response = synthetic_response(num_matches)
+        print(f'{num_matches} matches ({len(response) / 1024 / 1024:.1f}MiB)')
+
+        # Both keep the extracted matches, so the difference in memory is the document itself
+        _measure('  streaming', lambda: stream_matches(io.BytesIO(response)))
+        _measure('  whole document', lambda: whole_document_matches(io.BytesIO(response)))
+        if num_matches <= 10_000:
+            _measure('  streaming to models', lambda: parse_search_response(io.BytesIO(response)), memory=False)
+
+
+if __name__ == '__main__':
+    main()
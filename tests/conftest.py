@@ -2,6 +2,8 @@ import logging
 import sys
 import warnings
 
+from uuid import uuid4
+
 import pytest
 
 from requests_http_signature import HTTPSignatureAuth
@@ -32,3 +34,67 @@ def auth():
         key_id='dummykey',
         headers=['(request-target)', 'date'] if headers is None else headers
     )
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def check_request():
+    """
+    Builds the body of a check request for Henry Gnarglefoot, living in `country`.
+
+    `credentials` is True for the default provider credentials, or a dict of fields to override in them.
+    Any other keyword arguments replace top level fields of the request, such as `id` or `demo_result`.
+    """
+    def build(country='GBR', credentials=False, **fields):
+        request = {
+            'id': str(uuid4()),
+            'check_input': {
+                'entity_type': 'INDIVIDUAL',
+                'personal_details': {
+                    'name': {
+                        'given_names': ['Henry'],
+                        'family_name': 'Gnarglefoot'
+                    },
+                },
+                'address_history': [
+                    {
+                        'address': {
+                            'country': country
+                        }
+                    }
+                ]
+            },
+            'commercial_relationship': 'DIRECT',
+            'provider_config': {
+                'require_dob': False,
+                'mortality_check': True,
+                'requires_address_on_all_matches': False,
+                'run_original_address': False,
+            },
+            'demo_result': 'NO_MATCHES',
+        }
+        if credentials:
+            request['provider_credentials'] = {
+                'username': 'user',
+                'password': 'hunter2',
+                'url': 'https://example.com',
+                'public_key': 'public',
+                'private_key': 'private',
+                **(credentials if isinstance(credentials, dict) else {}),
+            }
+        request.update(fields)
+        return request
+
+    return build
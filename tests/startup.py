@@ -5,3 +5,63 @@ dummy_key = base64.b64decode('dummykey') + bytes(250)
 integration_key_store = {
     'dummykey': dummy_key
 }
+
+default_tenant_limit = {
+    'rate': 1000.0,
+    'burst': 1000,
+    'weight': 1.0,
+}
+
+tenant_limits = {}
+
+provider_concurrency = 2
+provider_queue_timeout = 1.0
+
+deadline_safety_margin = 2.0
+
+provider_retry_policy = {
+    'max_attempts': 3,
+    'hedge_percentile': None,
+}
+
+provider_session_cache = {
+    'max_sessions': 100,
+    'idle_timeout': 900.0,
+    'refresh_margin': 60.0,
+}
+
+check_mode = 'sync'
+async_checks = {
+    'workers': 2,
+    'max_queued': 100,
+    'directory': None,
+    'result_ttl': 3600.0,
+}
+async_check_timeout = 10.0
+
+idempotency = {
+    'ttl': 3600.0,
+    'max_entries': 1000,
+    'log_path': None,
+}
+
+audit_directory = None
+audit_policy = 'block'
+
+response_compression = {
+    'min_size': 1024,
+    'levels': {
+        'gzip': 1,
+        'br': 1,
+    },
+}
+
+trace_file = None
+trace_sample_rate = 0.0
+trace_slow_threshold = None
+
+memory_diagnostics = {
+    'enabled': False,
+    'frames': 16,
+    'interval': None,
+}
@@ -0,0 +1,100 @@
+import gzip
+import json
+import os
+import time
+
+import pytest
+
+from app.api import RunCheckRequest, RunCheckResponse, Charge
+from app.audit import AuditSink, DROP
+
+
+@pytest.fixture
+def check(check_request):
+    def build(credentials=True):
+        request = check_request(credentials=credentials, commercial_relationship='PASSFORT')
+        req = RunCheckRequest().import_data(request, apply_defaults=True)
+
+        res = RunCheckResponse()
+        res.charges = [Charge({'amount': 100, 'sku': 'NORMAL'})]
+        return req, res
+
+    return build
+
+
+def _read_records(directory):
+    records = []
+    for filename in sorted(os.listdir(directory)):
+        assert filename.endswith('.ndjson.gz')
+        with gzip.open(os.path.join(directory, filename), 'rt') as file:
+            records.extend(json.loads(line) for line in file)
+    return records
+
+
+def test_audit_records_written_on_close(tmp_path, check):
+    sink = AuditSink(str(tmp_path)).start()
+
+    checks = [check() for _ in range(5)]
+    for req, res in checks:
+        assert sink.submit(req, res)
+    sink.close()
+
+    records = _read_records(str(tmp_path))
+    assert [record['id'] for record in records] == [str(req.id) for req, _ in checks]
+
+    record = records[0]
+    assert 'provider_credentials' not in record['input']
+    assert record['input']['check_input']['personal_details']['name']['family_name'] == 'Gnarglefoot'
+    assert record['charges'] == [{'amount': 100, 'sku': 'NORMAL'}]
+    assert 'charges' not in record['output']
+    assert 'hunter2' not in json.dumps(record)
+
+
+def test_audit_segments_rotated_by_size(tmp_path, check):
+    sink = AuditSink(str(tmp_path), batch_size=1, max_segment_bytes=1).start()
+
+    for _ in range(3):
+        sink.submit(*check())
+    sink.close()
+
+    assert len(os.listdir(str(tmp_path))) == 3
+    assert len(_read_records(str(tmp_path))) == 3
+
+
+def test_audit_drops_when_full(tmp_path, check):
+    # Not started, so nothing is taken off the queue
+    sink = AuditSink(str(tmp_path), max_queue=2, policy=DROP)
+
+    assert sink.submit(*check())
+    assert sink.submit(*check(credentials=False))
+    assert not sink.submit(*check())
+
+    sink.start()
+    sink.close()
+
+    assert len(_read_records(str(tmp_path))) == 2
+
+
+def test_timed_out_checks_audited(tmp_path, session, auth, monkeypatch, check_request):
+    import app.application
+    import app.checks
+
+    extract_input = app.checks.extract_input
+
+    def slow_extract_input(req):
+        time.sleep(0.1)
+        return extract_input(req)
+
+    sink = AuditSink(str(tmp_path)).start()
+    monkeypatch.setattr(app.application, 'audit_sink', sink)
+    monkeypatch.setattr(app.application, 'CHECK_BUDGET', 0.05)
+    monkeypatch.setattr(app.checks, 'extract_input', slow_extract_input)
+
+    request = check_request()
+    r = session.post('http://app/checks', json=request, auth=auth())
+    assert r.json()['errors'][0]['data'] == {'stage': 'provider'}
+    sink.close()
+
+    [record] = _read_records(str(tmp_path))
+    assert record['id'] == request['id']
+    assert record['output']['errors'] == r.json()['errors']
@@ -0,0 +1,172 @@
+import json
+
+from uuid import uuid4
+
+import pytest
+
+from app import checks
+from app.bulk import BulkRunner, run_bulk, read_records, csv_request, Checkpoint, NDJSON, CSV
+
+TEMPLATE = {
+    'commercial_relationship': 'PASSFORT',
+    'provider_config': {
+        'require_dob': False,
+        'mortality_check': True,
+        'requires_address_on_all_matches': False,
+        'run_original_address': False,
+    },
+    'demo_result': 'ONE_NAME_ADDRESS_MATCH',
+}
+
+
+@pytest.fixture
+def record(check_request):
+    def build(**kwargs):
+        # The rest of the request comes from the template
+        request = check_request(**kwargs)
+        return {'id': request['id'], 'check_input': request['check_input']}
+
+    return build
+
+
+def _write_ndjson(path, count, record):
+    requests = []
+    with open(path, 'w') as file:
+        for i in range(count):
+            request = record(country=['GBR', 'FRA'][i % 2])
+            requests.append(request)
+            file.write(json.dumps(request) + '\n')
+            if i % 5 == 0:
+                # Blank lines are not records
+                file.write('\n')
+    return requests
+
+
+def _read_results(path):
+    with open(path, 'r') as file:
+        return [json.loads(line) for line in file]
+
+
+def _run(input_path, output_path, input_format=NDJSON, **kwargs):
+    return run_bulk(input_path, output_path, input_format, TEMPLATE, timeout=5, processes=2, chunk_size=4,
+                    progress_interval=0, **kwargs)
+
+
+def test_run_bulk_in_order(tmp_path, record):
+    input_path, output_path = str(tmp_path / 'input.ndjson'), str(tmp_path / 'output.ndjson')
+    requests = _write_ndjson(input_path, 21, record)
+
+    checked, _elapsed = _run(input_path, output_path)
+    assert checked == 21
+
+    results = _read_results(output_path)
+    assert [result['id'] for result in results] == [request['id'] for request in requests]
+
+    gbr, fra = results[0]['result'], results[1]['result']
+    assert gbr['errors'] == []
+    assert gbr['check_output']['electronic_id_check']['matches']
+    assert gbr['charges'] == [
+        {'amount': 100, 'reference': 'DUMMY REFERENCE'},
+        {'amount': 50, 'sku': 'NORMAL'},
+    ]
+    assert fra['errors'][0]['sub_type'] == 'UNSUPPORTED_COUNTRY'
+
+    assert Checkpoint.load(f'{output_path}.checkpoint').records == 21
+
+
+def test_run_bulk_invalid_records(tmp_path, record):
+    input_path, output_path = str(tmp_path / 'input.ndjson'), str(tmp_path / 'output.ndjson')
+    missing_name = record()
+    del missing_name['check_input']['personal_details']
+    bad_demo_result = {**record(), 'demo_result': 'bad-value'}
+    with open(input_path, 'w') as file:
+        file.write('{not json\n')
+        file.write(json.dumps({'id': 'not-a-uuid'}) + '\n')
+        file.write(json.dumps(missing_name) + '\n')
+        file.write(json.dumps(bad_demo_result) + '\n')
+
+    checked, _elapsed = _run(input_path, output_path)
+    assert checked == 4
+
+    invalid_json, invalid_request, missing, bad_demo = _read_results(output_path)
+    assert invalid_json['id'] is None
+    assert invalid_json['result']['errors'][0]['type'] == 'INVALID_CHECK_INPUT'
+    assert invalid_request['id'] == 'not-a-uuid'
+    assert invalid_request['result']['errors'][0]['type'] == 'INVALID_CHECK_INPUT'
+    assert missing['id'] == missing_name['id']
+    assert {error['data']['field'] for error in missing['result']['errors']} == {'GIVEN_NAMES', 'FAMILY_NAME'}
+    assert bad_demo['result']['errors'] == [{'type': 'INVALID_CHECK_INPUT', 'message': 'Invalid demo request'}]
+
+
+def test_run_record_unexpected_error(monkeypatch, record):
+    def run_check(req, deadline, live_check):
+        raise RuntimeError('Oops')
+
+    monkeypatch.setattr(checks, 'run_check', run_check)
+    request = record()
+
+    check_id, res = BulkRunner(NDJSON, TEMPLATE, timeout=5, max_attempts=1).run_record(json.dumps(request))
+    assert check_id == request['id']
+    assert res.errors[0].type == 'PROVIDER_CONNECTION'
+
+
+def test_run_bulk_resume(tmp_path, record):
+    input_path, output_path = str(tmp_path / 'input.ndjson'), str(tmp_path / 'output.ndjson')
+    _write_ndjson(input_path, 21, record)
+
+    _run(input_path, output_path)
+    with open(output_path, 'rb') as file:
+        expected = file.read()
+
+    # As if interrupted part way through writing the third chunk
+    output_bytes = sum(len(line) for line in expected.splitlines(keepends=True)[:8])
+    with open(output_path, 'wb') as file:
+        file.write(expected[:output_bytes + 10])
+    Checkpoint(records=8, output_bytes=output_bytes).save(f'{output_path}.checkpoint')
+
+    checked, _elapsed = _run(input_path, output_path, resume=True)
+    assert checked == 13
+
+    with open(output_path, 'rb') as file:
+        assert file.read() == expected
+
+
+def test_run_bulk_csv(tmp_path):
+    input_path, output_path = str(tmp_path / 'input.csv'), str(tmp_path / 'output.ndjson')
+    ids = [str(uuid4()) for _ in range(3)]
+    with open(input_path, 'w') as file:
+        file.write('id,given_names,family_name,dob,country,postal_code\n')
+        file.write(f'{ids[0]},Henry James,Gnarglefoot,1990-01-01,GBR,AB1 2CD\n')
+        file.write(f'{ids[1]},Henry,,,GBR,\n')
+        file.write(f'{ids[2]},Henry,Gnarglefoot,,FRA,\n')
+
+    _run(input_path, output_path, input_format=CSV)
+
+    results = _read_results(output_path)
+    assert [result['id'] for result in results] == ids
+    assert results[0]['result']['errors'] == []
+    assert results[1]['result']['errors'][0]['data']['field'] == 'FAMILY_NAME'
+    assert results[2]['result']['errors'][0]['sub_type'] == 'UNSUPPORTED_COUNTRY'
+
+
+def test_csv_request():
+    assert csv_request({'id': 'x', 'given_names': 'Henry  James', 'family_name': 'Gnarglefoot', 'dob': '',
+                        'country': 'GBR', 'street_number': '10', 'unknown': 'ignored'}) == {
+        'id': 'x',
+        'check_input': {
+            'entity_type': 'INDIVIDUAL',
+            'personal_details': {
+                'name': {'given_names': ['Henry', 'James'], 'family_name': 'Gnarglefoot'},
+            },
+            'address_history': [
+                {'address': {'type': 'STRUCTURED', 'country': 'GBR', 'street_number': '10'}},
+            ],
+        },
+    }
+
+
+def test_read_records_skip(tmp_path, record):
+    path = str(tmp_path / 'input.ndjson')
+    _write_ndjson(path, 10, record)
+    assert len(list(read_records(path, NDJSON))) == 10
+    assert list(read_records(path, NDJSON, skip=7)) == list(read_records(path, NDJSON))[7:]
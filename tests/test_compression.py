@@ -0,0 +1,85 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from app.compression import Compressor, compress, GZIP, BROTLI
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '../static/config.json')
+
+
+def test_gzip_round_trip():
+    data = b'{"matches": []}' * 100
+    assert gzip.decompress(compress(data, GZIP, 6)) == data
+
+
+def test_config_precompressed(session, auth):
+    with open(CONFIG_PATH, 'rb') as file:
+        expected = json.load(file)
+
+    r = session.get('http://app/config', auth=auth(), headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert r.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in r.headers['Vary']
+    assert r.json() == expected
+
+    r = session.get('http://app/config', auth=auth(), headers={'Accept-Encoding': 'identity'})
+    assert r.status_code == 200
+    assert 'Content-Encoding' not in r.headers
+    assert r.json() == expected
+
+
+def test_config_respects_rejected_encodings(session, auth):
+    r = session.get('http://app/config', auth=auth(), headers={'Accept-Encoding': 'gzip;q=0, *;q=0'})
+    assert r.status_code == 200
+    assert 'Content-Encoding' not in r.headers
+
+
+def test_config_conditional(session, auth):
+    r = session.get('http://app/config', auth=auth(), headers={'Accept-Encoding': 'gzip'})
+    etag = r.headers['ETag']
+
+    r = session.get('http://app/config', auth=auth(), headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert r.status_code == 304
+
+    # The uncompressed representation has a different tag
+    r = session.get('http://app/config', auth=auth(), headers={
+        'Accept-Encoding': 'identity',
+        'If-None-Match': etag
+    })
+    assert r.status_code == 200
+
+
+def test_metadata_too_small_to_compress(session):
+    r = session.get('http://app/', headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert 'Content-Encoding' not in r.headers
+
+
+def test_brotli(session, auth):
+    brotli = pytest.importorskip('brotli')
+
+    r = session.get('http://app/config', auth=auth(), headers={'Accept-Encoding': 'gzip, br'}, stream=True)
+    assert r.headers['Content-Encoding'] == BROTLI
+
+    with open(CONFIG_PATH, 'rb') as file:
+        assert json.loads(brotli.decompress(r.raw.read(decode_content=False))) == json.load(file)
+
+
+def test_run_check_compressed_above_threshold(session, auth, monkeypatch, check_request):
+    from app import application
+
+    monkeypatch.setattr(application, 'compressor', Compressor(min_size=0))
+    r = session.post('http://app/checks', json=check_request(demo_result='TWO_NAME_ADDRESS_MATCHES'), auth=auth(),
+                     headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert r.headers['Content-Encoding'] == 'gzip'
+    assert r.json()['check_output']['electronic_id_check']['matches']
+
+    monkeypatch.setattr(application, 'compressor', Compressor(min_size=1_000_000))
+    r = session.post('http://app/checks', json=check_request(demo_result='TWO_NAME_ADDRESS_MATCHES'), auth=auth(),
+                     headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert 'Content-Encoding' not in r.headers
+    assert r.json()['check_output']['electronic_id_check']['matches']
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from app.deadline import Deadline, DeadlineExceeded
+
+
+def test_deadline_tracks_stages(clock):
+    deadline = Deadline(10, clock=clock)
+
+    with deadline.stage('validation'):
+        clock.now += 2
+    with deadline.stage('provider'):
+        clock.now += 3
+
+    assert deadline.stages == {'validation': 2, 'provider': 3}
+    assert deadline.remaining() == 5
+    assert not deadline.expired
+
+
+def test_deadline_exceeded_on_next_stage(clock):
+    deadline = Deadline(1, clock=clock)
+
+    with deadline.stage('provider'):
+        clock.now += 2
+
+    assert deadline.remaining() == 0
+    with pytest.raises(DeadlineExceeded) as e:
+        with deadline.stage('serialization'):
+            pass
+    assert e.value.stage == 'serialization'
+
+
+def test_run_check_deadline_exceeded(session, auth, monkeypatch, check_request):
+    import app.application
+    import app.checks
+
+    extract_input = app.checks.extract_input
+
+    def slow_extract_input(req):
+        time.sleep(0.1)
+        return extract_input(req)
+
+    monkeypatch.setattr(app.application, 'CHECK_BUDGET', 0.05)
+    monkeypatch.setattr(app.checks, 'extract_input', slow_extract_input)
+
+    r = session.post('http://app/checks', json=check_request(), auth=auth())
+    assert r.status_code == 200
+
+    res = r.json()
+    assert res['errors'] == [{
+        'type': 'PROVIDER_CONNECTION',
+        'data': {
+            'stage': 'provider',
+        },
+        'message': 'Check timed out before it could be completed.',
+    }]
+
+
+def test_metrics_include_stages(session, auth, check_request):
+    r = session.post('http://app/checks', json=check_request(), auth=auth())
+    assert r.status_code == 200
+
+    r = session.get('http://app/metrics', auth=auth())
+    assert r.status_code == 200
+
+    stages = {value['labels']['stage'] for value in r.json()['check_stage_seconds']['values']}
+    assert {'auth', 'validation', 'extract_input', 'provider', 'serialization'} <= stages
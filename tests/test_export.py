@@ -0,0 +1,144 @@
+import json
+import os
+import random
+
+from uuid import uuid4
+
+import pytest
+
+from app.api import RunCheckResponse, RunCheckRequest
+from app.export import export
+
+DEMO_RESULTS_DIR = os.path.join(os.path.dirname(__file__), '../static/demo_results')
+
+
+def _maybe(rng, value):
+    roll = rng.random()
+    if roll < 0.2:
+        return None
+    if roll < 0.3:
+        # Left out entirely
+        return ...
+    return value
+
+
+def _prune(data):
+    if isinstance(data, dict):
+        return {key: _prune(value) for key, value in data.items() if value is not ...}
+    if isinstance(data, list):
+        return [_prune(value) for value in data]
+    return data
+
+
+def _random_address(rng):
+    return {
+        'type': 'STRUCTURED',
+        'country': rng.choice(['GBR', 'USA']),
+        'postal_code': _maybe(rng, 'AB1 2CD'),
+        'locality': _maybe(rng, 'London'),
+        'address_lines': _maybe(rng, ['Flat 1'] * rng.randrange(3)),
+        'original_structured_address': _maybe(rng, {'country': 'GBR', 'route': _maybe(rng, 'Test Street')}),
+    }
+
+
+def _random_individual(rng):
+    return {
+        'entity_type': 'INDIVIDUAL',
+        'personal_details': _maybe(rng, {
+            'name': _maybe(rng, {
+                'title': _maybe(rng, 'Dr'),
+                'given_names': _maybe(rng, ['Henry', 'James'][:rng.randrange(3)]),
+                'family_name': _maybe(rng, 'Gnarglefoot'),
+            }),
+            'dob': _maybe(rng, '1990-01-01'),
+            'national_identity_number': _maybe(rng, {'GBR': 'AB123456C'}),
+            'gender': _maybe(rng, rng.choice(['M', 'F'])),
+        }),
+        'address_history': _maybe(rng, [
+            {
+                'address': _random_address(rng),
+                'start_date': _maybe(rng, '2015-03-01'),
+            }
+            for _ in range(rng.randrange(3))
+        ]),
+        'contact_details': _maybe(rng, {'phone_number': _maybe(rng, '+441234567890')}),
+        'electronic_id_check': _maybe(rng, {
+            'provider_reference_number': _maybe(rng, 'REF'),
+            'matches': _maybe(rng, [
+                {
+                    'database_name': f'Database {i}',
+                    'database_type': rng.choice(['CIVIL', 'CREDIT', 'MORTALITY']),
+                    'matched_fields': rng.sample(['FORENAME', 'SURNAME', 'ADDRESS', 'DOB'], rng.randrange(5)),
+                    'date_first_seen': _maybe(rng, '2010-04-01'),
+                    'extra': _maybe(rng, [{'name': 'note', 'value': _maybe(rng, 'x')}]),
+                    'count': rng.randrange(3),
+                }
+                for i in range(rng.randrange(5))
+            ]),
+        }),
+    }
+
+
+def _random_response(rng):
+    return _prune({
+        'check_output': _maybe(rng, _random_individual(rng)),
+        'errors': _maybe(rng, [
+            {
+                'type': 'MISSING_CHECK_INPUT',
+                'message': 'Missing required field (DOB)',
+                'data': _maybe(rng, {'field': 'DOB'}),
+            }
+            for _ in range(rng.randrange(2))
+        ]),
+        'warnings': [],
+        'provider_data': _maybe(rng, rng.choice(['text', {'raw': [1, 2]}])),
+        'charges': _maybe(rng, [{'amount': 100, 'sku': _maybe(rng, 'NORMAL')}]),
+    })
+
+
+def _random_request(rng):
+    return _prune({
+        'id': str(uuid4()),
+        'demo_result': _maybe(rng, 'NO_MATCHES'),
+        'commercial_relationship': 'DIRECT',
+        'check_input': _random_individual(rng),
+        'provider_config': {
+            'require_dob': False,
+            'mortality_check': True,
+            'requires_address_on_all_matches': False,
+            'run_original_address': False,
+            'whitelisted_databases': _maybe(rng, ['Electoral Roll']),
+        },
+    })
+
+
+def _assert_exports_match(model_class, data):
+    # Separate instances, as serialize() validates (and so may modify) the model
+    expected = model_class().import_data(data, apply_defaults=True).serialize()
+    actual = export(model_class().import_data(data, apply_defaults=True))
+
+    assert actual == expected
+    assert json.dumps(actual, sort_keys=True) == json.dumps(expected, sort_keys=True)
+
+
+@pytest.mark.parametrize('filename', sorted(os.listdir(DEMO_RESULTS_DIR)))
+def test_export_demo_results(filename):
+    with open(os.path.join(DEMO_RESULTS_DIR, filename), 'r') as file:
+        _assert_exports_match(RunCheckResponse, json.load(file))
+
+
+def test_export_random_responses():
+    rng = random.Random(0)
+    for _ in range(300):
+        _assert_exports_match(RunCheckResponse, _random_response(rng))
+
+
+def test_export_random_requests():
+    rng = random.Random(1)
+    for _ in range(300):
+        _assert_exports_match(RunCheckRequest, _random_request(rng))
+
+
+def test_export_assigned_models():
+    res = RunCheckResponse.error([])
+    assert export(res) == res.serialize()
@@ -0,0 +1,207 @@
+import threading
+import time
+
+from uuid import uuid4
+
+import pytest
+
+from app import metrics
+from app.deadline import DeadlineExceeded
+from app.idempotency import IdempotencyStore
+
+
+class Check:
+    def __init__(self, response=None, delay=0):
+        self.response = {'errors': []} if response is None else response
+        self.delay = delay
+        self.runs = 0
+
+    def __call__(self):
+        time.sleep(self.delay)
+        self.runs += 1
+        return {**self.response, 'run': self.runs}
+
+
+def test_repeated_checks_not_run_again():
+    store = IdempotencyStore()
+    check = Check()
+
+    first = store.run('key', 'a', check, timeout=1)
+    assert store.run('key', 'a', check, timeout=1) == first
+    assert check.runs == 1
+
+    # Ids are only shared within a key
+    store.run('other', 'a', check, timeout=1)
+    store.run('key', 'b', check, timeout=1)
+    assert check.runs == 3
+
+
+def test_duplicates_wait_for_running_check():
+    store = IdempotencyStore()
+    check = Check(delay=0.1)
+
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(store.run('key', 'a', check, timeout=1)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert check.runs == 1
+    assert responses == [{'errors': [], 'run': 1}] * 5
+
+
+def test_duplicates_give_up_at_timeout():
+    store = IdempotencyStore()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_check():
+        started.set()
+        release.wait()
+        return {'errors': []}
+
+    thread = threading.Thread(target=lambda: store.run('key', 'a', slow_check, timeout=1))
+    thread.start()
+    started.wait()
+    try:
+        with pytest.raises(DeadlineExceeded):
+            store.run('key', 'a', Check(), timeout=0.01)
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_retryable_errors_not_recorded():
+    store = IdempotencyStore()
+    check = Check({'errors': [{'type': 'PROVIDER_CONNECTION', 'message': 'Timed out'}]})
+
+    store.run('key', 'a', check, timeout=1)
+    store.run('key', 'a', check, timeout=1)
+    assert check.runs == 2
+
+    def failing_check():
+        raise DeadlineExceeded('provider')
+
+    with pytest.raises(DeadlineExceeded):
+        store.run('key', 'b', failing_check, timeout=1)
+    store.run('key', 'b', check, timeout=1)
+    assert check.runs == 3
+
+
+def test_results_expire(clock):
+    store = IdempotencyStore(ttl=60, max_entries=2, clock=clock)
+    check = Check()
+
+    for check_id in ['a', 'b', 'c']:
+        store.run('key', check_id, check, timeout=1)
+    assert len(store) == 2
+
+    # `a` was dropped to make room for `c`
+    store.run('key', 'a', check, timeout=1)
+    assert check.runs == 4
+
+    clock.now += 60
+    store.run('key', 'c', check, timeout=1)
+    assert check.runs == 5
+
+
+def test_log_survives_restart(tmp_path, clock):
+    log_path = str(tmp_path / 'idempotency.ndjson')
+    store = IdempotencyStore(ttl=60, log_path=log_path, clock=clock).start()
+    check = Check()
+
+    expired = store.run('key', 'expired', check, timeout=1)
+    clock.now += 30
+    kept = store.run('key', 'kept', check, timeout=1)
+    store.close()
+
+    # As if the process stopped part way through writing a line
+    with open(log_path, 'a') as file:
+        file.write('{"key_id": "key", "id": "partial", "rec')
+
+    clock.now += 40
+    store = IdempotencyStore(ttl=60, log_path=log_path, clock=clock).start()
+    assert store.run('key', 'kept', check, timeout=1) == kept
+    assert store.run('key', 'expired', check, timeout=1) != expired
+    assert check.runs == 3
+    store.close()
+
+    with open(log_path, 'r') as file:
+        assert len(file.readlines()) == 2
+
+
+def test_log_written_off_request_path(tmp_path, monkeypatch):
+    store = IdempotencyStore(log_path=str(tmp_path / 'idempotency.ndjson')).start()
+    release = threading.Event()
+    write = store._write
+    monkeypatch.setattr(store, '_write', lambda batch: release.wait() and write(batch))
+
+    # Neither new checks nor lookups wait for the log
+    check = Check()
+    for check_id in ['a', 'b', 'a']:
+        store.run('key', check_id, check, timeout=1)
+    assert check.runs == 2
+
+    release.set()
+    store.close()
+    with open(str(tmp_path / 'idempotency.ndjson'), 'r') as file:
+        assert len(file.readlines()) == 2
+
+
+def test_log_compacted(tmp_path):
+    log_path = str(tmp_path / 'idempotency.ndjson')
+    store = IdempotencyStore(max_entries=5, log_path=log_path).start()
+
+    for _ in range(50):
+        store.run('key', str(uuid4()), Check(), timeout=1)
+    store.close()
+
+    with open(log_path, 'r') as file:
+        assert len(file.readlines()) <= 10
+
+
+def test_run_check_retried(session, auth, check_request):
+    def hits():
+        values = metrics.snapshot()['idempotent_checks']['values']
+        return sum(value['value'] for value in values if value['labels'] == {'outcome': 'hit'})
+
+    request = check_request(commercial_relationship='PASSFORT', demo_result='ONE_NAME_ADDRESS_MATCH')
+    before = hits()
+
+    r = session.post('http://app/checks', json=request, auth=auth())
+    assert r.status_code == 200
+    first = r.json()
+    assert first['charges']
+
+    r = session.post('http://app/checks', json=request, auth=auth())
+    assert r.status_code == 200
+    assert r.json() == first
+    assert hits() == before + 1
+
+
+def test_late_results_recorded(session, auth, monkeypatch, check_request):
+    import app.application
+
+    run_check = app.application.checks.run_check
+    runs = []
+
+    def late_run_check(req, deadline, live_check):
+        res = run_check(req, deadline, live_check)
+        runs.append(req.id)
+        # As if the provider answered just as the timeout ran out
+        deadline.expires_at = deadline.clock()
+        return res
+
+    monkeypatch.setattr(app.application.checks, 'run_check', late_run_check)
+    request = check_request(commercial_relationship='PASSFORT', demo_result='ONE_NAME_ADDRESS_MATCH')
+
+    r = session.post('http://app/checks', json=request, auth=auth())
+    assert r.status_code == 200
+    first = r.json()
+    assert first['errors'] == [] and first['charges']
+
+    r = session.post('http://app/checks', json=request, auth=auth())
+    assert r.json() == first
+    assert len(runs) == 1
@@ -0,0 +1,182 @@
+import threading
+import time
+
+from uuid import uuid4
+
+import pytest
+
+from app.api import RunCheckRequest, RunCheckResponse, ErrorType
+from app.jobs import JobQueue, QueueFull, QUEUED, COMPLETE
+
+
+@pytest.fixture
+def job_request(check_request):
+    def build(**fields):
+        return RunCheckRequest().import_data(check_request(credentials=True, **fields), apply_defaults=True)
+
+    return build
+
+
+def _wait_for(queue, key_id, check_id, timeout=5):
+    give_up_at = time.monotonic() + timeout
+    while time.monotonic() < give_up_at:
+        job = queue.get(key_id, check_id)
+        if job.state == COMPLETE:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'Check {check_id} did not complete')
+
+
+def test_jobs_run_in_background(job_request):
+    release = threading.Event()
+    completed = []
+
+    def run(job):
+        release.wait()
+        return RunCheckResponse()
+
+    queue = JobQueue(run, workers=1, on_complete=completed.append).start()
+    try:
+        job = queue.submit('key', job_request())
+        assert job.state != COMPLETE
+
+        # Resubmitting returns the same job, rather than running it again
+        assert queue.submit('key', job.request) is job
+        # Other keys can't see it
+        assert queue.get('other', job.id) is None
+
+        release.set()
+        assert _wait_for(queue, 'key', job.id).response is not None
+        assert completed == [job]
+    finally:
+        queue.close()
+
+
+def test_credentials_dropped_once_run(job_request):
+    queue = JobQueue(lambda job: RunCheckResponse(), workers=1).start()
+    try:
+        job = queue.submit('key', job_request(demo_result=None))
+        assert job.request.provider_credentials is not None
+
+        _wait_for(queue, 'key', job.id)
+        queue.close()
+        assert job.request.provider_credentials is None
+    finally:
+        queue.close()
+
+
+def test_queue_bounded(job_request):
+    queue = JobQueue(lambda job: RunCheckResponse(), workers=0, max_queued=2).start()
+
+    queue.submit('key', job_request())
+    queue.submit('key', job_request())
+    with pytest.raises(QueueFull):
+        queue.submit('key', job_request())
+    assert len(queue) == 2
+
+
+def test_failed_jobs_complete_with_error(job_request):
+    def run(job):
+        raise RuntimeError('Oops')
+
+    queue = JobQueue(run, workers=1).start()
+    try:
+        job = queue.submit('key', job_request())
+        res = _wait_for(queue, 'key', job.id).response
+        assert res.errors[0].type == ErrorType.PROVIDER_CONNECTION
+    finally:
+        queue.close()
+
+
+def test_invalid_jobs_not_retryable(job_request):
+    from app import application
+
+    queue = JobQueue(application._run_queued_check, workers=1).start()
+    try:
+        job = queue.submit('key', job_request(demo_result='bad-value'))
+        res = _wait_for(queue, 'key', job.id).response
+        assert res.errors[0].type == ErrorType.INVALID_CHECK_INPUT
+        assert res.errors[0].message == 'Invalid demo request'
+    finally:
+        queue.close()
+
+
+def test_results_expire(clock, job_request):
+    queue = JobQueue(lambda job: RunCheckResponse(), workers=0, result_ttl=60, max_results=2, clock=clock)
+
+    jobs = [queue.submit('key', job_request()) for _ in range(3)]
+    for job in jobs:
+        queue._complete(job, RunCheckResponse())
+
+    # Only the most recent `max_results` are kept
+    assert queue.get('key', jobs[0].id) is None
+    assert queue.get('key', jobs[1].id) is jobs[1]
+
+    clock.now = 60
+    assert queue.get('key', jobs[2].id) is None
+
+
+def test_queued_jobs_recovered(tmp_path, job_request):
+    directory = str(tmp_path)
+    queue = JobQueue(lambda job: RunCheckResponse(), workers=0, directory=directory).start()
+    demo = queue.submit('key', job_request())
+    live = queue.submit('key', job_request(demo_result=None))
+
+    for path in tmp_path.iterdir():
+        assert 'hunter2' not in path.read_text()
+
+    ran = []
+
+    def run(job):
+        ran.append(job.id)
+        return RunCheckResponse()
+
+    queue = JobQueue(run, workers=1, directory=directory).start()
+    try:
+        assert _wait_for(queue, 'key', demo.id).response.errors == []
+        # Without its credentials, the live check can't be run
+        assert _wait_for(queue, 'key', live.id).response.errors[0].type == ErrorType.PROVIDER_CONNECTION
+        assert ran == [demo.id]
+        assert list(tmp_path.iterdir()) == []
+    finally:
+        queue.close()
+
+
+def test_async_checks(session, auth, monkeypatch, check_request):
+    from app import application
+
+    r = session.get(f'http://app/checks/{uuid4()}', auth=auth())
+    assert r.status_code == 404
+
+    queue = JobQueue(application._run_queued_check, workers=1).start()
+    monkeypatch.setattr(application, 'job_queue', queue)
+    try:
+        check = check_request(credentials=True, demo_result='ONE_NAME_ADDRESS_MATCH')
+        r = session.post('http://app/checks', json=check, auth=auth())
+        assert r.status_code == 202
+        assert r.json()['id'] == check['id']
+        assert r.json()['state'] in {QUEUED, 'RUNNING'}
+
+        r = session.get(f'http://app/checks/{uuid4()}', auth=auth())
+        assert r.status_code == 404
+        r = session.get(f'http://app/checks/{check["id"]}')
+        assert r.status_code == 401
+
+        _wait_for(queue, 'dummykey', check['id'])
+        r = session.get(f'http://app/checks/{check["id"]}', auth=auth())
+        assert r.status_code == 200
+        assert r.json()['errors'] == []
+        assert r.json()['check_output']['electronic_id_check']['matches']
+    finally:
+        queue.close()
+
+
+def test_async_checks_queue_full(session, auth, monkeypatch, check_request):
+    from app import application
+
+    monkeypatch.setattr(application, 'job_queue', JobQueue(application._run_queued_check, workers=0, max_queued=1))
+
+    r = session.post('http://app/checks', json=check_request(credentials=True), auth=auth())
+    assert r.status_code == 202
+    r = session.post('http://app/checks', json=check_request(credentials=True), auth=auth())
+    assert r.status_code == 429
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+import tests.startup
+
+from app import metrics
+from benchmarks.loadgen import Signer, prepare_requests, app_target, run
+
+
+def test_loadgen_in_process(session):
+    from main import app
+
+    prepared = prepare_requests(['GBR', 'FRA'], ['NO_MATCHES'], [0, 2], count=20)
+    assert len(prepared) == 20
+    assert len({json.loads(request.body)['id'] for request in prepared}) == 20
+
+    def hits():
+        values = metrics.snapshot()['idempotent_checks']['values']
+        return sum(value['value'] for value in values if value['labels'] == {'outcome': 'hit'})
+
+    hits_before = hits()
+    signer = Signer('dummykey', tests.startup.dummy_key)
+    report = run(app_target(app), signer, prepared, rate=100, duration=0.2, concurrency=4)
+    # Every check was run, rather than answered from the idempotency store
+    assert hits() == hits_before
+
+    assert len(report.latencies) == 20
+    assert report.statuses == {200: 20}
+    assert report.errors == 0
+    assert 0 < report.percentile(50) <= report.percentile(99.9)
+
+    with pytest.raises(ValueError):
+        run(app_target(app), signer, prepared, rate=100, duration=0.3, concurrency=4)
@@ -0,0 +1,87 @@
+import tracemalloc
+
+import pytest
+
+from flask import Flask
+
+from app import metrics
+from app.api import Address
+from app.checks import CheckInput, run_demo_check
+from app.memory import MemoryDiagnostics
+
+
+@pytest.fixture
+def diagnostics():
+    was_tracing = tracemalloc.is_tracing()
+    app = Flask(__name__)
+
+    @app.route('/allocate')
+    def allocate():
+        return str(len(bytearray(64 * 1024)))
+
+    diagnostics = MemoryDiagnostics(enabled=True).init_app(app)
+    diagnostics.app = app
+    yield diagnostics
+
+    diagnostics.close()
+    if not was_tracing:
+        tracemalloc.stop()
+
+
+def _demo_result():
+    check_input = CheckInput(
+        current_address=Address({'country': 'GBR'}),
+        dob=None,
+        given_names=['Henry'],
+        family_name='Gnarglefoot'
+    )
+    return run_demo_check(check_input, 'TWO_NAME_ADDRESS_MATCHES')
+
+
+def test_disabled_costs_nothing():
+    app = Flask(__name__)
+    MemoryDiagnostics(enabled=False).init_app(app)
+
+    assert not app.before_request_funcs and not app.teardown_request_funcs
+
+
+def test_report_attributes_memory_to_app_modules(diagnostics):
+    retained = _demo_result()
+
+    report = diagnostics.report(since='start')
+    assert report['traced_bytes'] > 0
+    assert report['changes']['app/checks.py'] > 0
+    assert report['models']['RunCheckResponse'] >= 1
+    assert retained.check_output is not None
+
+
+def test_request_memory_growth(diagnostics):
+    def request_count():
+        values = metrics.snapshot()['request_memory_growth_bytes']['values']
+        return sum(value['value']['count'] for value in values)
+
+    before = request_count()
+    diagnostics.app.test_client().get('/allocate')
+    assert request_count() == before + 1
+
+
+def test_memory_endpoint(session, auth, diagnostics, monkeypatch):
+    from app import application
+
+    r = session.get('http://app/diagnostics/memory', auth=auth())
+    assert r.status_code == 404
+
+    monkeypatch.setattr(application, 'diagnostics', diagnostics)
+
+    r = session.get('http://app/diagnostics/memory')
+    assert r.status_code == 401
+
+    r = session.get('http://app/diagnostics/memory?since=last&limit=3', auth=auth())
+    assert r.status_code == 200
+    report = r.json()
+    assert report['since'] == 'last'
+    assert len(report['modules']) <= 3
+    assert {'rss_bytes', 'traced_bytes', 'traced_peak_bytes', 'changes', 'models'} <= set(report)
+
+    r = session.get('http://app/diagnostics/memory?since=yesterday', auth=auth())
+    assert r.status_code == 400
@@ -0,0 +1,65 @@
+from app.pricing import PriceTable
+
+
+def _table(maximum_cost=200):
+    return PriceTable(
+        {'amount': 100, 'reference': 'REF'},
+        [
+            {'sku': 'NORMAL', 'country': '*', 'matched_databases': '*', 'amount': 50},
+            {'sku': 'NORMAL', 'country': '*', 'matched_databases': 2, 'amount': 60},
+            {'sku': 'NORMAL', 'country': 'USA', 'matched_databases': '*', 'amount': 70},
+            {'sku': 'NORMAL', 'country': 'USA', 'matched_databases': 0, 'amount': 10},
+        ],
+        maximum_cost=maximum_cost
+    )
+
+
+def test_price_most_specific_row_wins():
+    table = _table()
+
+    assert table.price('NORMAL', 'GBR', 0) == 50
+    assert table.price('NORMAL', 'GBR', 2) == 60
+    # Counts above the largest tier share its price
+    assert table.price('NORMAL', 'GBR', 5) == 60
+    assert table.price('NORMAL', 'USA', 0) == 10
+    assert table.price('NORMAL', 'USA', 2) == 70
+    assert table.price('UNKNOWN', 'GBR', 0) is None
+
+
+def test_charges():
+    charges = [charge.serialize() for charge in _table().charges('GBR', 1)]
+    assert charges == [
+        {'amount': 100, 'reference': 'REF'},
+        {'amount': 50, 'sku': 'NORMAL'},
+    ]
+
+
+def test_charges_capped_at_maximum_cost():
+    charges = [charge.serialize() for charge in _table(maximum_cost=120).charges('GBR', 1)]
+    assert charges == [
+        {'amount': 100, 'reference': 'REF'},
+        {'amount': 20, 'sku': 'NORMAL'},
+    ]
+
+    charges = [charge.serialize() for charge in _table(maximum_cost=100).charges('GBR', 1)]
+    assert charges == [{'amount': 100, 'reference': 'REF'}]
+
+
+def _demo_check(session, auth, check_request, demo_result):
+    request = check_request(commercial_relationship='PASSFORT', demo_result=demo_result)
+    r = session.post('http://app/checks', json=request, auth=auth())
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_run_check_charges(session, auth, check_request):
+    res = _demo_check(session, auth, check_request, 'ONE_NAME_ADDRESS_MATCH')
+    assert res['charges'] == [
+        {'amount': 100, 'reference': 'DUMMY REFERENCE'},
+        {'amount': 50, 'sku': 'NORMAL'},
+    ]
+
+
+def test_run_check_errors_not_charged(session, auth, check_request):
+    res = _demo_check(session, auth, check_request, 'ERROR_CONNECTION_TO_PROVIDER')
+    assert res['charges'] == []
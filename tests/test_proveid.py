@@ -0,0 +1,86 @@
+import io
+
+import pytest
+
+from app.provider import InvalidCredentialsError, ProviderMessageError
+from app.proveid import parse_search_response
+from benchmarks.proveid_parser import synthetic_response, stream_matches, whole_document_matches
+
+RESPONSE = b'''<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+  <soap:Body>
+    <SearchResponse xmlns="http://xml.proveid.experian.com/">
+      <ProviderReference>REF-1</ProviderReference>
+      <Matches>
+        <Match>
+          <DatabaseName>CAIS Active Lenders</DatabaseName>
+          <DatabaseType>CREDIT</DatabaseType>
+          <Count>1</Count>
+          <MatchedFields>
+            <Field>FORENAME</Field>
+            <Field>SURNAME</Field>
+            <Field>NOT_A_FIELD</Field>
+          </MatchedFields>
+          <DateFirstSeen>2010-04-01</DateFirstSeen>
+        </Match>
+        <Match>
+          <DatabaseName>Something New</DatabaseName>
+          <DatabaseType>UNKNOWN</DatabaseType>
+          <Count>0</Count>
+          <MatchedFields/>
+        </Match>
+      </Matches>
+    </SearchResponse>
+  </soap:Body>
+</soap:Envelope>'''
+
+
+def _fault(code, message):
+    return f'''<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+      <soap:Body>
+        <soap:Fault>
+          <faultcode>{code}</faultcode>
+          <faultstring>{message}</faultstring>
+        </soap:Fault>
+      </soap:Body>
+    </soap:Envelope>'''.encode()
+
+
+def test_parse_search_response():
+    result = parse_search_response(io.BytesIO(RESPONSE))
+
+    assert result.serialize() == {
+        'provider_reference_number': 'REF-1',
+        'matches': [
+            {
+                'database_name': 'CAIS Active Lenders',
+                'database_type': 'CREDIT',
+                'matched_fields': ['FORENAME', 'SURNAME'],
+                'date_first_seen': '2010-04-01',
+                'count': 1,
+            },
+            {
+                'database_name': 'Something New',
+                'database_type': 'IGNORED',
+                'matched_fields': [],
+                'count': 0,
+            },
+        ],
+    }
+
+
+def test_parse_matches_whole_document():
+    response = synthetic_response(500)
+
+    streamed = stream_matches(io.BytesIO(response))
+    assert len(streamed) == 500
+    assert streamed == whole_document_matches(io.BytesIO(response))
+
+
+def test_parse_faults():
+    with pytest.raises(InvalidCredentialsError):
+        parse_search_response(io.BytesIO(_fault('soap:Client.Authentication', 'Login failed')))
+
+    with pytest.raises(ProviderMessageError) as e:
+        parse_search_response(io.BytesIO(_fault('soap:Server', 'Service unavailable')))
+    assert str(e.value) == 'Service unavailable'
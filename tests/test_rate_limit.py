@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from app.rate_limit import RateLimitStore, InMemoryRateLimitStore, RateLimit, RateLimiter, FairScheduler
+
+
+def test_token_bucket_allows_burst_then_refills(clock):
+    limiter = RateLimiter(InMemoryRateLimitStore(), default=RateLimit(rate=2, burst=3), clock=clock)
+
+    assert [limiter.check('tenant') for _ in range(3)] == [0, 0, 0]
+    assert limiter.check('tenant') == 0.5
+
+    # Other tenants have their own bucket
+    assert limiter.check('other') == 0
+
+    clock.now += 0.5
+    assert limiter.check('tenant') == 0
+    assert limiter.check('tenant') > 0
+
+
+def test_token_bucket_per_tenant_limits(clock):
+    limiter = RateLimiter(
+        InMemoryRateLimitStore(),
+        default=RateLimit(rate=1, burst=1),
+        limits={'big': RateLimit(rate=1, burst=5)},
+        clock=clock
+    )
+
+    assert sum(limiter.check('big') == 0 for _ in range(10)) == 5
+    assert sum(limiter.check('small') == 0 for _ in range(10)) == 1
+
+
+def test_incomplete_store_rejected():
+    class IncompleteStore(RateLimitStore):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteStore()
+
+
+def test_fair_scheduler_interleaves_tenants():
+    scheduler = FairScheduler(1)
+    order = []
+
+    # Hold the only slot while both tenants queue up
+    assert scheduler.acquire('holder')
+
+    def worker(tenant):
+        with scheduler.slot(tenant, timeout=5):
+            order.append(tenant)
+
+    threads = []
+    for tenant in ['bursty'] * 4 + ['quiet']:
+        thread = threading.Thread(target=worker, args=(tenant,))
+        thread.start()
+        threads.append(thread)
+        # Make sure the requests are queued in a known order
+        time.sleep(0.02)
+
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+
+    # The quiet tenant should not have to wait behind the whole burst
+    assert order.index('quiet') <= 1
+
+
+def test_fair_scheduler_times_out():
+    scheduler = FairScheduler(1)
+    assert scheduler.acquire('a')
+    assert not scheduler.acquire('b', timeout=0.01)
+
+    # The timed out waiter must not be handed the slot
+    scheduler.release()
+    assert scheduler.acquire('c', timeout=0)
+
+
+def test_run_check_rate_limited(session, auth, monkeypatch, check_request):
+    from app.application import rate_limiter
+
+    monkeypatch.setattr(rate_limiter, 'store', InMemoryRateLimitStore())
+    monkeypatch.setitem(rate_limiter.limits, 'dummykey', RateLimit(rate=0.1, burst=1))
+
+    def post():
+        return session.post('http://app/checks', json=check_request(), auth=auth())
+
+    assert post().status_code == 200
+
+    r = post()
+    assert r.status_code == 429
+    assert r.headers['retry-after'] == '10'
@@ -0,0 +1,155 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.api import RunCheckResponse
+from app.deadline import Deadline, DeadlineExceeded
+from app.provider import ProviderClient, ProviderSession, ProviderConnectionError, InvalidCredentialsError
+from app.retry import RetryingProvider, RetryPolicy, LatencyTracker
+
+
+class StubProvider(ProviderClient):
+    """
+    Fails with a connection error for the first `failures` calls, and takes `delays[n]` seconds to answer call `n`.
+    """
+
+    def __init__(self, failures=0, delays=(), error=ProviderConnectionError):
+        self.failures = failures
+        self.delays = delays
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def authenticate(self, credentials, timeout):
+        return ProviderSession(token='token')
+
+    def run_check(self, check_input, req, timeout, session=None):
+        with self._lock:
+            call = self.calls
+            self.calls += 1
+
+        if call < len(self.delays):
+            time.sleep(self.delays[call])
+        if call < self.failures:
+            raise self.error(f'Failure {call}')
+
+        res = RunCheckResponse()
+        res.provider_data = f'Call {call}'
+        return res
+
+
+def _retrying(provider, **policy):
+    return RetryingProvider(provider, RetryPolicy(**policy), sleep=lambda delay: None)
+
+
+def test_retries_connection_errors():
+    provider = StubProvider(failures=2)
+    res = _retrying(provider, hedge_percentile=None).run_check(None, None, Deadline(5))
+
+    assert res.provider_data == 'Call 2'
+    assert provider.calls == 3
+
+
+def test_gives_up_after_max_attempts():
+    provider = StubProvider(failures=5)
+    with pytest.raises(ProviderConnectionError):
+        _retrying(provider, max_attempts=3, hedge_percentile=None).run_check(None, None, Deadline(5))
+
+    assert provider.calls == 3
+
+
+def test_terminal_errors_not_retried():
+    provider = StubProvider(failures=5, error=InvalidCredentialsError)
+    with pytest.raises(InvalidCredentialsError):
+        _retrying(provider, hedge_percentile=None).run_check(None, None, Deadline(5))
+
+    assert provider.calls == 1
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(base_delay=0.1, max_delay=1)
+
+    assert policy.backoff(0, rand=lambda: 1) == 0.1
+    assert policy.backoff(2, rand=lambda: 1) == 0.4
+    assert policy.backoff(10, rand=lambda: 1) == 1
+    assert policy.backoff(10, rand=lambda: 0.5) == 0.5
+
+
+def test_retries_bounded_by_deadline():
+    provider = StubProvider(failures=5)
+    retrying = RetryingProvider(provider, RetryPolicy(max_attempts=5, base_delay=10, hedge_percentile=None))
+
+    started_at = time.monotonic()
+    with pytest.raises(ProviderConnectionError):
+        retrying.run_check(None, None, Deadline(0.5))
+
+    # Backoff never sleeps beyond the deadline
+    assert time.monotonic() - started_at < 1
+
+
+def test_slow_provider_exceeds_deadline():
+    provider = StubProvider(delays=[1])
+    with pytest.raises(DeadlineExceeded):
+        _retrying(provider, hedge_percentile=None).run_check(None, None, Deadline(0.1))
+
+
+def test_hedges_slow_requests():
+    latencies = LatencyTracker()
+    for _ in range(20):
+        latencies.record(0.01)
+
+    # The first request hangs, the hedged request answers straight away
+    provider = StubProvider(delays=[1, 0])
+    retrying = RetryingProvider(provider, RetryPolicy(hedge_percentile=95), latencies=latencies)
+
+    started_at = time.monotonic()
+    res = retrying.run_check(None, None, Deadline(5))
+
+    assert res.provider_data == 'Call 1'
+    assert time.monotonic() - started_at < 0.5
+
+
+def test_abandoned_requests_cancelled():
+    latencies = LatencyTracker()
+    for _ in range(20):
+        latencies.record(0.01)
+
+    # The hedged request can't start until the first one finishes, after the deadline
+    provider = StubProvider(delays=[0.3])
+    executor = ThreadPoolExecutor(max_workers=1)
+    retrying = RetryingProvider(provider, RetryPolicy(hedge_percentile=95), executor=executor, latencies=latencies)
+
+    with pytest.raises(DeadlineExceeded):
+        retrying.run_check(None, None, Deadline(0.1))
+
+    executor.shutdown(wait=True)
+    assert provider.calls == 1
+
+
+def test_no_hedging_without_enough_samples():
+    provider = StubProvider(delays=[0.1])
+    res = _retrying(provider, hedge_percentile=95).run_check(None, None, Deadline(5))
+
+    assert res.provider_data == 'Call 0'
+    assert provider.calls == 1
+
+
+def test_latency_percentile():
+    latencies = LatencyTracker()
+    for latency in range(1, 101):
+        latencies.record(latency)
+
+    assert latencies.percentile(50) == 50
+    assert latencies.percentile(95) == 95
+    assert latencies.percentile(100) == 100
+
+
+def test_incomplete_client_rejected():
+    class IncompleteProvider(ProviderClient):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteProvider()
@@ -0,0 +1,173 @@
+import threading
+import time
+
+import pytest
+
+from app.api import ProviderCredentials, RunCheckRequest, RunCheckResponse
+from app.deadline import Deadline
+from app.provider import ProviderClient, ProviderSession, InvalidCredentialsError
+from app.retry import RetryingProvider, RetryPolicy
+from app.sessions import SessionCache
+
+
+class SessionProvider(ProviderClient):
+    def __init__(self, expires_in=None, delay=0, refreshable=True):
+        self.expires_in = expires_in
+        self.delay = delay
+        self.refreshable = refreshable
+        self.authentications = 0
+        self.refreshes = 0
+        self.sessions_used = []
+        self.reject_sessions = False
+
+    def authenticate(self, credentials, timeout):
+        time.sleep(self.delay)
+        self.authentications += 1
+        if credentials.password == 'wrong':
+            raise InvalidCredentialsError('Invalid username or password')
+        return ProviderSession(token=f'token-{self.authentications}', expires_in=self.expires_in)
+
+    def refresh(self, session, timeout):
+        if not self.refreshable:
+            return None
+        self.refreshes += 1
+        return ProviderSession(token=f'{session.token}-refreshed', expires_in=self.expires_in)
+
+    def run_check(self, check_input, req, timeout, session=None):
+        self.sessions_used.append(session)
+        if self.reject_sessions:
+            raise InvalidCredentialsError('Session expired')
+        return RunCheckResponse()
+
+
+@pytest.fixture
+def credentials(check_request):
+    def build(username='user', password='hunter2'):
+        request = check_request(credentials={'username': username, 'password': password})
+        return ProviderCredentials(request['provider_credentials'])
+
+    return build
+
+
+def test_sessions_cached_by_credentials(credentials):
+    provider = SessionProvider()
+    cache = SessionCache(provider)
+
+    first = cache.get(credentials(), timeout=1)
+    assert cache.get(credentials(), timeout=1) is first
+    assert provider.authentications == 1
+
+    assert cache.get(credentials(password='changed'), timeout=1) is not first
+    assert cache.get(credentials(username='other'), timeout=1) is not first
+    assert provider.authentications == 3
+
+
+def test_concurrent_requests_share_authentication(credentials):
+    provider = SessionProvider(delay=0.1)
+    cache = SessionCache(provider)
+
+    sessions = []
+    threads = [threading.Thread(target=lambda: sessions.append(cache.get(credentials(), timeout=1)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert provider.authentications == 1
+    assert len(sessions) == 5 and all(session is sessions[0] for session in sessions)
+
+
+def test_failed_authentication_not_cached(credentials):
+    provider = SessionProvider()
+    cache = SessionCache(provider)
+
+    for _ in range(2):
+        with pytest.raises(InvalidCredentialsError):
+            cache.get(credentials(password='wrong'), timeout=1)
+    assert provider.authentications == 2
+    assert len(cache) == 0
+
+
+def test_least_recently_used_evicted(credentials):
+    provider = SessionProvider()
+    cache = SessionCache(provider, max_sessions=2)
+
+    a = cache.get(credentials('a'), timeout=1)
+    cache.get(credentials('b'), timeout=1)
+    # `a` is now more recently used than `b`
+    cache.get(credentials('a'), timeout=1)
+    cache.get(credentials('c'), timeout=1)
+
+    assert len(cache) == 2
+    assert cache.get(credentials('a'), timeout=1) is a
+    assert provider.authentications == 3
+
+    cache.get(credentials('b'), timeout=1)
+    assert provider.authentications == 4
+
+
+def test_idle_sessions_dropped(clock, credentials):
+    cache = SessionCache(SessionProvider(), idle_timeout=60, clock=clock)
+
+    cache.get(credentials('a'), timeout=1)
+    clock.now = 50
+    cache.get(credentials('b'), timeout=1)
+    clock.now = 70
+    cache.sweep()
+
+    assert len(cache) == 1
+
+
+def test_expired_sessions_not_used(clock, credentials):
+    provider = SessionProvider(expires_in=100, refreshable=False)
+    cache = SessionCache(provider, clock=clock)
+
+    first = cache.get(credentials(), timeout=1)
+    clock.now = 99
+    cache.sweep()
+    assert cache.get(credentials(), timeout=1) is first
+
+    clock.now = 100
+    assert cache.get(credentials(), timeout=1) is not first
+    assert provider.authentications == 2
+
+
+def test_sessions_refreshed_before_expiry(clock, credentials):
+    provider = SessionProvider(expires_in=100)
+    cache = SessionCache(provider, refresh_margin=30, clock=clock)
+
+    cache.get(credentials(), timeout=1)
+    clock.now = 60
+    cache.sweep()
+    assert provider.refreshes == 0
+
+    clock.now = 80
+    cache.sweep()
+    assert provider.refreshes == 1
+
+    clock.now = 150
+    assert cache.get(credentials(), timeout=1).token == 'token-1-refreshed'
+    assert provider.authentications == 1
+
+
+def test_retrying_provider_uses_sessions(check_request):
+    provider = SessionProvider()
+    cache = SessionCache(provider)
+    retrying = RetryingProvider(provider, RetryPolicy(hedge_percentile=None), sessions=cache)
+
+    def request(credentials=True):
+        return RunCheckRequest().import_data(check_request(credentials=credentials), apply_defaults=True)
+
+    retrying.run_check(None, request(), Deadline(5))
+    retrying.run_check(None, request(), Deadline(5))
+    retrying.run_check(None, request(credentials=False), Deadline(5))
+
+    assert provider.authentications == 1
+    assert [session and session.token for session in provider.sessions_used] == ['token-1', 'token-1', None]
+
+    # Rejected sessions are dropped, so the next check authenticates again
+    provider.reject_sessions = True
+    with pytest.raises(InvalidCredentialsError):
+        retrying.run_check(None, request(), Deadline(5))
+    assert len(cache) == 0
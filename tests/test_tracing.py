@@ -0,0 +1,108 @@
+import json
+
+from app.tracing import Trace, Tracer, FileSpanExporter, span, tag_trace
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+
+
+def _read_spans(path):
+    with open(path, 'r') as file:
+        return [json.loads(line) for line in file]
+
+
+def test_traceparent():
+    trace = Trace.from_traceparent(f'00-{TRACE_ID}-{PARENT_ID}-01')
+    assert trace.trace_id == TRACE_ID
+    assert trace.parent_span_id == PARENT_ID
+    assert trace.sampled
+
+    assert not Trace.from_traceparent(f'00-{TRACE_ID}-{PARENT_ID}-00').sampled
+
+    for invalid in [None, '', 'garbage', f'ff-{TRACE_ID}-{PARENT_ID}-01', f'00-{"0" * 32}-{PARENT_ID}-01',
+                    f'00-{TRACE_ID}-{"0" * 16}-01', f'00-{TRACE_ID}-{PARENT_ID}']:
+        assert Trace.from_traceparent(invalid) is None
+
+
+def test_spans_exported_with_trace_attributes(tmp_path):
+    path = str(tmp_path / 'traces.ndjson')
+    exporter = FileSpanExporter(path, flush_interval=0.01).start()
+    tracer = Tracer(exporter, sample_rate=1.0)
+
+    root = tracer.start_trace('request', path='/checks')
+    with span('outer'):
+        with span('inner', size=3):
+            pass
+    tag_trace(check_id='abc')
+    tracer.end_trace(root)
+    exporter.close()
+
+    spans = {s['name']: s for s in _read_spans(path)}
+    assert set(spans) == {'request', 'outer', 'inner'}
+    assert spans['inner']['parent_span_id'] == spans['outer']['span_id']
+    assert spans['outer']['parent_span_id'] == spans['request']['span_id']
+    assert spans['request']['parent_span_id'] is None
+    assert spans['inner']['attributes'] == {'check_id': 'abc', 'size': 3}
+    assert all(s['trace_id'] == root.trace.trace_id for s in spans.values())
+
+
+def test_unsampled_traces_not_recorded(tmp_path):
+    path = str(tmp_path / 'traces.ndjson')
+    exporter = FileSpanExporter(path, flush_interval=0.01).start()
+    tracer = Tracer(exporter, sample_rate=0.0)
+
+    root = tracer.start_trace('request')
+    assert root is None
+    with span('outer') as outer:
+        assert outer is None
+    tracer.end_trace(root)
+
+    # Unless the caller sampled them
+    root = tracer.start_trace('request', f'00-{TRACE_ID}-{PARENT_ID}-01')
+    tracer.end_trace(root)
+    exporter.close()
+
+    spans = _read_spans(path)
+    assert [(s['trace_id'], s['parent_span_id']) for s in spans] == [(TRACE_ID, PARENT_ID)]
+
+
+def test_slow_traces_kept(tmp_path):
+    path = str(tmp_path / 'traces.ndjson')
+    exporter = FileSpanExporter(path, flush_interval=0.01).start()
+
+    tracer = Tracer(exporter, sample_rate=0.0, slow_threshold=0.0)
+    tracer.end_trace(tracer.start_trace('slow'))
+
+    tracer = Tracer(exporter, sample_rate=0.0, slow_threshold=60)
+    tracer.end_trace(tracer.start_trace('fast'))
+    exporter.close()
+
+    assert [s['name'] for s in _read_spans(path)] == ['slow']
+
+
+def test_run_check_traced(session, auth, tmp_path, monkeypatch, check_request):
+    from app import application
+
+    path = str(tmp_path / 'traces.ndjson')
+    exporter = FileSpanExporter(path, flush_interval=0.01).start()
+    monkeypatch.setattr(application, 'tracer', Tracer(exporter, sample_rate=1.0))
+
+    request = check_request()
+    r = session.post('http://app/checks', json=request, auth=auth(headers=[
+        '(request-target)', 'date', 'digest'
+    ]), headers={'traceparent': f'00-{TRACE_ID}-{PARENT_ID}-01'})
+    assert r.status_code == 200
+    exporter.close()
+
+    spans = {s['name']: s for s in _read_spans(path)}
+    assert {'request', 'auth', 'digest', 'signature', 'validation', 'import', 'validate', 'extract_input',
+            'provider', 'serialization', 'compression'} <= set(spans)
+
+    for s in spans.values():
+        assert s['trace_id'] == TRACE_ID
+        assert s['attributes']['check_id'] == request['id']
+
+    assert spans['request']['parent_span_id'] == PARENT_ID
+    assert spans['request']['attributes']['status_code'] == 200
+    assert spans['digest']['parent_span_id'] == spans['auth']['span_id']
+    assert spans['import']['parent_span_id'] == spans['validation']['span_id']